@@ -1,11 +1,31 @@
 import os
+import math
+import mmap
+import struct
+import sqlite3
+import json
+import array
+import asyncio
+import hashlib
+import re
+import bisect
+import heapq
+import time
+import random
 import logging
-import requests
+import httpx
+from collections import Counter, OrderedDict, defaultdict, deque
 from datetime import datetime, timedelta
-from telegram.ext import Application, CommandHandler, ConversationHandler, MessageHandler, filters, ContextTypes
-from telegram import Update
+from telegram.ext import Application, BaseUpdateProcessor, CallbackQueryHandler, ConversationHandler, MessageHandler, filters, ContextTypes
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, MessageEntity, Update
+from telegram.error import BadRequest
 from dotenv import load_dotenv
 
+try:
+    import fcntl  # byte-range locks for counters shared between processes (POSIX only)
+except ImportError:
+    fcntl = None
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -20,83 +40,1679 @@ logger = logging.getLogger(__name__)
 SONG_FILE = 'song_list.txt'
 ACTIVITY_FILE = 'activity_list.txt'
 
+# Where suggestions are stored: 'sqlite' (the bot database, migrated once from the files above)
+# or 'files' (the plain text files, for admins who prefer editing them by hand)
+LIST_STORE = os.getenv('LIST_STORE', 'sqlite')
+
+# /displaylists pagination
+LIST_PAGE_SIZE = 25  # entries per page
+LIST_PAGE_MAX_CHARS = 4000  # stay under Telegram's 4096-character message limit
+LISTS = {
+    # name -> (title, text when empty)
+    'songs': ("Song List", "No songs available."),
+    'activities': ("Activity List", "No activities available."),
+}
+
+# Updates handled at once; updates from the same chat still run one at a time, in order
+MAX_CONCURRENT_UPDATES = 64
+
 # Define conversation states
 SONG_NAME, SONG_ARTIST, SUGGEST_ACTIVITY = range(3)
 
 # Define the wedding date
 WEDDING_DATE = datetime(2026, 12, 12)
 
-# Counter for tracking messages
-MESSAGE_COUNTER = 0
+# Post a quote every this many messages in a chat
+QUOTE_EVERY_MESSAGES = 20
+
+# Quote cadence: never more often than the minimum interval, stretched further while a chat is busy
+QUOTE_MIN_INTERVAL = timedelta(minutes=10)
+QUOTE_MAX_INTERVAL = timedelta(hours=1)
+QUOTE_BASELINE_RATE = 2 / 60  # messages per second considered normal chatter
+QUOTE_RATE_WINDOW = timedelta(minutes=5)  # EWMA time constant for the message rate
+
+# Chats with no messages for this long have their counters dropped
+CHAT_IDLE_TIMEOUT = timedelta(days=7)
+CHAT_EVICT_INTERVAL = timedelta(hours=1)
+
+# Sliding windows for /stats: (buckets, seconds per bucket) for the last hour, day and week
+STATS_WINDOWS = {
+    'hour': (60, 60),
+    'day': (24, 3600),
+    'week': (7, 86400),
+}
+
+# HyperLogLog precision for distinct-sender counts: 2**10 one-byte registers (1 KiB), ~3% error
+SENDER_SKETCH_PRECISION = 10
+SENDER_SKETCH_DAYS = 7
+
+# Heavy-hitters sketch size for /leaderboard (guests tracked per chat) and how many to show
+LEADERBOARD_CAPACITY = 50
+LEADERBOARD_SIZE = 10
+
+# Trending phrases: words and bigrams counted per chat with counts halved every half-life
+TRENDING_CAPACITY = 200
+TRENDING_HALF_LIFE = timedelta(hours=2)
+TRENDING_MAX_TOKENS = 50  # only the start of very long messages is counted
+TRENDING_SIZE = 10
+STOPWORDS = frozenset('''
+    a about after all also am an and any are as at be because been but by can could did do does
+    for from get got had has have he her here him his how i i'm if in into is it it's its just
+    know like me more my no not now of off oh ok okay on one or our out so some than that that's
+    the their them then there they this to too up us was we were what when where which who why
+    will with would yes you your
+'''.split())
+
+# Counters shared by several bot processes through a memory-mapped file, e.g. /dev/shm/weddingbot_counters
+SHARED_COUNTER_FILE = os.getenv('SHARED_COUNTER_FILE')
+SHARED_COUNTER_SLOTS = 4096  # chats active within CHAT_IDLE_TIMEOUT the shared table can hold (32 bytes each)
+
+# Short answers posted when a message mentions an FAQ topic
+FAQ_ANSWERS = {
+    'date': "The wedding is on December 12th, 2026 at 2 pm.",
+    'venue': "The ceremony and the reception are both at The Club at Bella Collina.",
+    'dress_code': "The dress code is Semi-Formal/Cocktail Attire.",
+    'children': "Children are welcome if needed.",
+    'parking': "Yes, there is parking at the venue, and carpool drivers will also be available.",
+    'plus_one': "You can request a plus-one by the RSVP date.",
+    'dietary': "Special dietary options are available on request.",
+    'photos': "Yes, photos and videos are welcome during the ceremony. Please share them in the group chat!",
+    'rehearsal': "There's no official rehearsal dinner, but there will be a dinner with family and close friends.",
+}
+
+# Phrases that trigger each FAQ answer (matched as whole words, case-insensitive); bare nouns
+# like 'photos' or 'kids' come up in ordinary chatter too often to be left in
+FAQ_KEYWORDS = {
+    'date': [
+        'wedding date', 'which date', 'what day is the wedding', 'when is the wedding',
+        'what time is the wedding', 'what time does the ceremony', 'what time does it start', 'start time',
+        'ceremony time', 'what time should we arrive', 'what time should i arrive',
+    ],
+    'venue': [
+        'where is the wedding', 'where is the ceremony', 'where is the reception', 'wedding location',
+        'ceremony location', 'reception location', 'bella collina', 'the address', 'venue address',
+        'where is it being held', 'where are we going',
+    ],
+    'dress_code': [
+        'dress code', 'dresscode', 'what to wear', 'what should i wear', 'what should we wear', 'what do i wear',
+        'attire', 'cocktail attire', 'semi formal', 'semi-formal', 'black tie', 'tux', 'tuxedo', 'suit and tie',
+        'wear a suit', 'wear jeans', 'wear white',
+    ],
+    'children': [
+        'children', 'bring my kids', 'bring the kids', 'bring my son', 'bring my daughter',
+        'bring the baby', 'bring my baby', 'babies', 'toddler', 'babysitter', 'kids invited', 'children invited',
+    ],
+    'parking': [
+        'parking', 'park my car', 'where to park', 'where do we park', 'where do i park', 'valet', 'carpool',
+        'car pool', 'shuttle', 'ride to the venue', 'ride to the wedding',
+    ],
+    'plus_one': [
+        'plus one', 'plus-one', 'plus 1', 'bring a date', 'bring my date', 'bring someone',
+        'bring a guest', 'bring my girlfriend', 'bring my boyfriend', 'bring my partner',
+    ],
+    'dietary': [
+        'dietary', 'vegan', 'vegetarian', 'gluten', 'gluten free', 'gluten-free', 'allergy', 'allergies',
+        'allergic', 'kosher', 'halal', 'nut free', 'dairy free', 'food options', 'menu options',
+    ],
+    'photos': [
+        'take pictures', 'take photos', 'film the ceremony', 'record the ceremony', 'unplugged',
+        'phones during the ceremony', 'cameras allowed', 'photos allowed',
+    ],
+    'rehearsal': ['rehearsal', 'rehearsal dinner', 'dinner the night before'],
+}
+
+# Only messages that look like questions get an answer: a '?' or one of these phrases
+FAQ_QUESTION_CUES = [
+    "what is", "what's", 'what time', 'what should', 'what do', 'what are', 'when is', 'when does', 'when do',
+    'where is', 'where do', 'where can', 'where should', 'where to', 'which date', 'which day', 'which time', 'how do',
+    'how does', 'how can', 'is there', 'are there', 'are we', 'can i', 'can we', 'could i', 'could we', 'do i',
+    'do we', 'do you', 'does anyone', 'anyone know', 'should i', 'should we', 'will there', 'is it ok',
+    'am i allowed', 'are we allowed', 'are kids allowed', 'is it allowed', 'wondering', 'any idea',
+]
+FAQ_ANSWER_COOLDOWN = timedelta(minutes=30)  # per chat and topic
+
+# SQLite database for bot state; counters are written behind in batches
+BOT_DB_FILE = os.getenv('BOT_DB_FILE', 'wedding_bot.db')
+# Counter changes live only in memory until the next flush, so a crash loses up to this much counting.
+# There is deliberately no per-message log: a disk write per message is the cost write-behind avoids,
+# and a few lost counts only delay the next automatic quote.
+COUNTER_FLUSH_INTERVAL = timedelta(seconds=30)
+
+# ZenQuotes API settings
+QUOTE_API_URL = 'https://zenquotes.io/api/random'
+QUOTE_BULK_API_URL = 'https://zenquotes.io/api/quotes'  # ~50 quotes per call
+QUOTE_CONNECT_TIMEOUT = 3.0  # seconds
+QUOTE_READ_TIMEOUT = 5.0  # seconds
+QUOTE_API_BUDGET = 5  # free ZenQuotes clients get 5 requests...
+QUOTE_API_BUDGET_PERIOD = timedelta(seconds=30)  # ...per 30 seconds
+QUOTE_BREAKER_FAILURES = 3  # consecutive failures before the circuit opens
+QUOTE_BREAKER_RESET = timedelta(minutes=2)  # how long the circuit stays open before a retry
+
+# Optional local HTTP stand-in serving ZenQuotes-style JSON, tried after ZenQuotes
+QUOTE_LOCAL_API_URL = os.getenv('QUOTE_LOCAL_API_URL')
+
+# Latency budget before a quote request is hedged to the next provider
+QUOTE_HEDGE_DELAY = 1.5  # seconds
+
+# In-memory quote reservoir, kept full by a background job
+QUOTE_RESERVOIR_SIZE = 100
+QUOTE_RESERVOIR_LOW_WATER = 20  # refill once fewer quotes than this remain
+QUOTE_REFILL_INTERVAL = timedelta(minutes=1)
+
+# Persistent on-disk quote cache
+QUOTE_CACHE_FILE = 'quote_cache.json'
+QUOTE_CACHE_TTL = timedelta(days=30)
+QUOTE_CACHE_MAX_SIZE = 5000
+
+# Offline quote corpus (one 'quote — author' per line), used as the primary or fallback source
+QUOTE_CORPUS_FILE = os.getenv('QUOTE_CORPUS_FILE', 'quote_corpus.txt')
+QUOTE_SOURCE = os.getenv('QUOTE_SOURCE', 'zenquotes')  # 'zenquotes' or 'offline'
+
+# Per-chat record of quotes already posted, so groups don't see repeats
+QUOTE_SEEN_BITS = 8192  # 1 KiB Bloom filter per chat
+QUOTE_SEEN_HASHES = 4
+QUOTE_SEEN_CAPACITY = 800  # quotes per filter before it resets (~1% false positives)
+QUOTE_SEEN_MAX_CHATS = 10000  # least recently active chats are forgotten beyond this
+QUOTE_UNSEEN_ATTEMPTS = 8  # random picks to try before moving on to the next source
+
+# Latency histogram bucket upper bounds, in milliseconds
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Words matched by /quote <topic>
+WORD_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def tokenize(text):
+    """Split text into lowercase word tokens."""
+    return WORD_PATTERN.findall(text.lower())
+
+
+class LatencyHistogram:
+    """Fixed-bucket latency histogram with a running count, sum and max."""
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # the last bucket holds everything above the top bound
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    # Record one observation
+    def observe(self, ms):
+        """Add a latency in milliseconds."""
+        self.counts[bisect.bisect_left(self.bounds, ms)] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    # Estimate a percentile from the buckets
+    def percentile(self, fraction):
+        """Return the upper bound of the bucket holding the given fraction of observations."""
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return self.max
+
+    def summary(self):
+        """Summarize the histogram as a dict."""
+        if not self.count:
+            return {'count': 0}
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count, 1),
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'p99_ms': self.percentile(0.99),
+            'max_ms': round(self.max, 1),
+        }
+
+
+class Telemetry:
+    """In-process counters and latency histograms, readable at any time."""
 
-class WeddingBot:
     def __init__(self):
+        self.counters = Counter()
+        self.histograms = defaultdict(LatencyHistogram)
+
+    def increment(self, name, amount=1):
+        self.counters[name] += amount
+
+    def observe(self, name, seconds):
+        self.histograms[name].observe(seconds * 1000)
+
+    # Ratio between sums of counters
+    def ratio(self, names, total_names):
+        """Return sum(counters[names]) / sum(counters[total_names]), or None if nothing was counted."""
+        total = sum(self.counters[name] for name in total_names)
+        return sum(self.counters[name] for name in names) / total if total else None
+
+    # Current values of everything recorded
+    def snapshot(self):
+        """Return all counters and histogram summaries as a plain dict."""
+        return {
+            'counters': dict(sorted(self.counters.items())),
+            'histograms': {name: histogram.summary() for name, histogram in sorted(self.histograms.items())},
+        }
+
+    # Render everything recorded as text
+    def format(self):
+        """Render counters and histograms one per line."""
+        lines = [f"{name}: {value}" for name, value in sorted(self.counters.items())]
+        for name, histogram in sorted(self.histograms.items()):
+            details = ', '.join(f"{key}={value}" for key, value in histogram.summary().items())
+            lines.append(f"{name}: {details}")
+        return '\n'.join(lines) or "No metrics recorded yet."
+
+
+# Process-wide metrics registry
+telemetry = Telemetry()
+
+# Where get_quote found its answer; the first two count as cache hits
+QUOTE_SOURCES = ('reservoir', 'cache', 'upstream', 'corpus', 'repeat', 'failed')
+QUOTE_HIT_SOURCES = ('reservoir', 'cache')
+
+
+class QuoteCache:
+    """Quotes persisted to disk with a TTL and a size bound, oldest evicted first."""
+
+    def __init__(self, path, ttl=QUOTE_CACHE_TTL, max_size=QUOTE_CACHE_MAX_SIZE):
+        self.path = path
+        self.ttl = ttl.total_seconds()
+        self.max_size = max_size
+        self.quotes = OrderedDict()  # quote text -> time it was fetched
+        self.texts = []  # the same quotes in a flat list for O(1) random picks
+        self.positions = {}  # quote text -> index into texts
+        self.index = defaultdict(set)  # word -> quotes containing it
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.quotes)
+
+    # Load cached quotes from disk
+    def load(self):
+        """Read the cache file, dropping anything that has expired."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as file:
+                entries = json.load(file)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable quote cache {self.path}: {e}")
+            return
+        for entry in sorted(entries, key=lambda entry: entry['fetched_at']):
+            self.insert(entry['text'], entry['fetched_at'])
+        self.evict()
+        logger.info(f"Loaded {len(self.quotes)} quotes from {self.path}")
+
+    # Write cached quotes to disk
+    def save(self):
+        """Atomically write the cache file if anything changed."""
+        if not self.dirty:
+            return
+        entries = [{'text': text, 'fetched_at': fetched_at} for text, fetched_at in self.quotes.items()]
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w') as file:
+                json.dump(entries, file)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
+        except OSError as e:
+            logger.warning(f"Could not save quote cache {self.path}: {e}")
+
+    # Add freshly fetched quotes
+    def add_many(self, quotes):
+        """Insert or refresh quotes, then enforce the TTL and size bound."""
+        now = time.time()
+        for text in quotes:
+            self.insert(text, now)
+        self.dirty = True
+        self.evict()
+
+    # Insert or refresh a single quote
+    def insert(self, text, fetched_at):
+        """Add a quote as the newest entry, keeping the random-access list in sync."""
+        if text in self.quotes:
+            self.quotes.move_to_end(text)
+        else:
+            self.positions[text] = len(self.texts)
+            self.texts.append(text)
+            for token in set(tokenize(text)):
+                self.index[token].add(text)
+        self.quotes[text] = fetched_at
+
+    # Drop expired quotes and trim to the size bound
+    def evict(self):
+        """Remove expired entries and the oldest ones beyond max_size."""
+        cutoff = time.time() - self.ttl
+        while self.quotes:
+            text, fetched_at = next(iter(self.quotes.items()))
+            if fetched_at >= cutoff and len(self.quotes) <= self.max_size:
+                break
+            self.quotes.popitem(last=False)
+            # Swap the last quote into the evicted slot so removal stays O(1)
+            position = self.positions.pop(text)
+            last = self.texts.pop()
+            if last != text:
+                self.texts[position] = last
+                self.positions[last] = position
+            for token in set(tokenize(text)):
+                self.index[token].discard(text)
+                if not self.index[token]:
+                    del self.index[token]
+            self.dirty = True
+
+    # Pick random cached quotes
+    def sample(self, count):
+        """Return up to count distinct random quotes from the cache."""
+        return random.sample(self.texts, min(count, len(self.texts)))
+
+    # Pick one random cached quote
+    def random_quote(self):
+        """Return a random cached quote in O(1), or None if the cache is empty."""
+        return random.choice(self.texts) if self.texts else None
+
+    # Look up quotes by topic
+    def search(self, topic):
+        """Return the cached quotes containing every word of the topic."""
+        postings = sorted((self.index.get(token, set()) for token in set(tokenize(topic))), key=len)
+        if not postings:
+            return set()
+        # Intersect starting from the rarest word so the work is bounded by the smallest set
+        return postings[0].intersection(*postings[1:])
+
+
+class OfflineQuoteCorpus:
+    """Memory-mapped quote file with a line offset index for O(1) random picks."""
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = f"{path}.idx"
+        with open(path, 'rb') as file:
+            self.mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.offsets = self.load_index() or self.build_index()
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    # Reuse the offset index from a previous run if the corpus hasn't changed since
+    def load_index(self):
+        """Load the saved offset index, or return None if it is missing or stale."""
+        try:
+            if os.path.getmtime(self.index_path) < os.path.getmtime(self.path):
+                return None
+            offsets = array.array('Q')
+            with open(self.index_path, 'rb') as file:
+                offsets.frombytes(file.read())
+        except (OSError, ValueError):
+            return None
+        if not offsets or offsets[-1] != len(self.mm):
+            return None
+        return offsets
+
+    # Scan the corpus once for line start offsets
+    def build_index(self):
+        """Record where every line starts (plus the end of file) and save the index."""
+        offsets = array.array('Q', [0])
+        position = self.mm.find(b'\n')
+        while position != -1:
+            offsets.append(position + 1)
+            position = self.mm.find(b'\n', position + 1)
+        if offsets[-1] != len(self.mm):
+            offsets.append(len(self.mm))
+        try:
+            with open(self.index_path, 'wb') as file:
+                offsets.tofile(file)
+        except OSError as e:
+            logger.warning(f"Could not save quote corpus index {self.index_path}: {e}")
+        logger.info(f"Indexed {len(offsets) - 1} quotes in {self.path}")
+        return offsets
+
+    # Read one quote by line number
+    def get(self, line):
+        """Return the quote on the given line, read straight from the mapped file."""
+        return self.mm[self.offsets[line]:self.offsets[line + 1]].decode('utf-8', errors='replace').strip()
+
+    # Pick a random quote
+    def random_quote(self):
+        """Return a random non-empty quote, or None if the corpus is empty."""
+        for _ in range(10):
+            quote = self.get(random.randrange(len(self)))
+            if quote:
+                return quote
+        return None
+
+
+class SeenQuotes:
+    """Per-chat Bloom filters of quotes already posted, reset once they fill up."""
+
+    def __init__(self, bits=QUOTE_SEEN_BITS, hashes=QUOTE_SEEN_HASHES,
+                 capacity=QUOTE_SEEN_CAPACITY, max_chats=QUOTE_SEEN_MAX_CHATS):
+        self.bits = bits
+        self.hashes = hashes
+        self.capacity = capacity
+        self.max_chats = max_chats
+        self.filters = OrderedDict()  # chat id -> [bit array, quotes added], least recent first
+
+    # Bit positions for a quote (double hashing from one digest)
+    def positions(self, quote):
+        """Return the filter bit positions for a quote."""
+        digest = hashlib.blake2b(quote.encode('utf-8'), digest_size=8).digest()
+        h1 = int.from_bytes(digest[:4], 'little')
+        h2 = int.from_bytes(digest[4:], 'little') | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    # Check whether a chat has (probably) seen a quote
+    def seen(self, chat_id, quote):
+        """Return True if the quote was probably posted to the chat already."""
+        entry = self.filters.get(chat_id)
+        if entry is None:
+            return False
+        bitset = entry[0]
+        return all(bitset[position >> 3] & (1 << (position & 7)) for position in self.positions(quote))
+
+    # Record a quote as posted to a chat
+    def add(self, chat_id, quote):
+        """Mark the quote as seen, starting a fresh filter once the current one is full."""
+        entry = self.filters.get(chat_id)
+        if entry is None or entry[1] >= self.capacity:
+            entry = [bytearray(self.bits // 8), 0]
+            self.filters[chat_id] = entry
+            if len(self.filters) > self.max_chats:
+                self.filters.popitem(last=False)
+        self.filters.move_to_end(chat_id)
+        bitset = entry[0]
+        for position in self.positions(quote):
+            bitset[position >> 3] |= 1 << (position & 7)
+        entry[1] += 1
+
+
+class TokenBucket:
+    """Token bucket that spends at most capacity requests per period."""
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period.total_seconds()
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    # Take a token if one is available
+    def try_acquire(self):
+        """Return True and spend a token, or False if the budget is used up."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class CircuitBreaker:
+    """Stops calling a failing upstream until a cool-down has passed."""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout.total_seconds()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False  # a half-open trial call is in flight
+
+    # Check whether a call may go through
+    def allow(self):
+        """Return False while open; once the cool-down has passed, let a single trial call through."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.transition(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self.probing:
+                return False
+            self.probing = True
+        return True
+
+    # Give back the trial slot of a call that never reached the upstream
+    def release(self):
+        """Let another caller make the half-open trial call."""
+        self.probing = False
+
+    # Record a successful call
+    def record_success(self):
+        """Close the circuit and reset the failure count."""
+        self.failures = 0
+        self.probing = False
+        if self.state != self.CLOSED:
+            self.transition(self.CLOSED)
+
+    # Record a failed call
+    def record_failure(self):
+        """Open the circuit after too many failures, or straight away from half-open."""
+        self.failures += 1
+        self.probing = False
+        if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+            self.opened_at = time.monotonic()
+            self.transition(self.OPEN)
+
+    # Change state and record the transition
+    def transition(self, state):
+        """Move to a new state, logging and counting the transition."""
+        telemetry.increment(f"breaker.{self.name}.{self.state}->{state}")
+        logger.info(f"Circuit breaker '{self.name}' {self.state} -> {state}")
+        self.state = state
+
+
+class ChatCounters:
+    """Per-chat message counters, ordered by last activity so idle chats are cheap to evict.
+
+    Each chat costs one dict entry for its count and one for its last-seen time (plain
+    ints, no per-chat objects). Updates never await, so they are atomic on the event
+    loop even when updates are processed concurrently.
+    """
+
+    def __init__(self):
+        self.counts = OrderedDict()  # chat id -> messages since the last quote, least recent first
+        self.last_seen = {}  # chat id -> monotonic second of the chat's latest message
+        self.quoted_at = {}  # chat id -> monotonic time of the chat's latest quote
+        self.dirty = set()  # chats changed since the last flush
+
+    def __len__(self):
+        return len(self.counts)
+
+    # Restore counts loaded from the database
+    def restore(self, counts):
+        """Seed counters from persisted (chat id, count) pairs, treating them as just seen."""
+        now = int(time.monotonic())
+        for chat_id, count in counts:
+            self.counts[chat_id] = count
+            self.last_seen[chat_id] = now
+
+    # Hand over the counters changed since the last flush
+    def take_dirty(self):
+        """Return (chat id, count) for every changed chat still in memory, and clear the dirty set."""
+        rows = [(chat_id, self.counts[chat_id]) for chat_id in self.dirty if chat_id in self.counts]
+        self.dirty.clear()
+        return rows
+
+    # Count a message and report whether the chat reached the threshold
+    def tick(self, chat_id, every, gap=0.0):
+        """Add one message; return True (and start counting over) once `every` messages are counted
+        and at least gap seconds have passed since the chat's last quote."""
+        now = time.monotonic()
+        count = self.counts.pop(chat_id, 0) + 1
+        self.last_seen[chat_id] = int(now)
+        fire = count >= every and now - self.quoted_at.get(chat_id, -math.inf) >= gap
+        if fire:
+            count = 0
+            self.quoted_at[chat_id] = now
+        self.counts[chat_id] = count
+        self.dirty.add(chat_id)
+        return fire
+
+    # Drop chats that have gone quiet
+    def evict_idle(self, max_idle):
+        """Forget chats idle for longer than max_idle and return how many were dropped."""
+        cutoff = time.monotonic() - max_idle.total_seconds()
+        evicted = 0
+        while self.counts:
+            chat_id = next(iter(self.counts))
+            if self.last_seen[chat_id] >= cutoff:
+                break
+            del self.counts[chat_id]
+            del self.last_seen[chat_id]
+            self.quoted_at.pop(chat_id, None)
+            self.dirty.discard(chat_id)
+            evicted += 1
+        return evicted
+
+
+class RingCounter:
+    """Event counts over a sliding window, kept as a ring of fixed-width time buckets."""
+
+    def __init__(self, slots, width):
+        self.slots = slots
+        self.width = width  # seconds per bucket
+        self.buckets = array.array('I', bytes(4 * slots))
+        self.head = 0  # bucket number (time // width) of the newest bucket
+        self.total = 0  # running sum of all buckets
+
+    # Move the window forward, clearing buckets that fell out of it
+    def advance(self, now):
+        """Slide the window to now; amortized O(1) since each bucket is cleared once per lap."""
+        bucket = int(now // self.width)
+        if bucket - self.head >= self.slots:
+            self.buckets = array.array('I', bytes(4 * self.slots))
+            self.total = 0
+        else:
+            for expired in range(self.head + 1, bucket + 1):
+                self.total -= self.buckets[expired % self.slots]
+                self.buckets[expired % self.slots] = 0
+        self.head = max(self.head, bucket)
+
+    def add(self, now, amount=1):
+        self.advance(now)
+        self.buckets[self.head % self.slots] += amount
+        self.total += amount
+
+    def count(self, now):
+        """Return the number of events in the window ending now."""
+        self.advance(now)
+        return self.total
+
+
+class HyperLogLog:
+    """Approximate distinct counter in 2**precision bytes; sketches merge by register-wise max."""
+
+    def __init__(self, precision=SENDER_SKETCH_PRECISION, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = registers if registers is not None else bytearray(self.size)
+
+    def add(self, value):
+        h = int.from_bytes(hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest(), 'big')
+        index = h >> (64 - self.precision)
+        rest = h & ((1 << (64 - self.precision)) - 1)
+        # Position of the leftmost 1-bit in the remaining bits
+        rank = (64 - self.precision) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    # Combine with another sketch
+    def merge(self, other):
+        """Return a new sketch counting the union of both."""
+        return HyperLogLog(self.precision, bytearray(map(max, self.registers, other.registers)))
+
+    def count(self):
+        """Return the estimated number of distinct values added."""
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        estimate = alpha * self.size * self.size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.size and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = self.size * math.log(self.size / zeros)
+        return round(estimate)
+
+
+class DailySketches:
+    """One HyperLogLog per day for the last few days, merged on demand for multi-day totals."""
+
+    def __init__(self, days=SENDER_SKETCH_DAYS):
+        self.days = days
+        self.sketches = {}  # day number -> HyperLogLog, only for days with traffic
+
+    def add(self, value, now):
+        day = int(now // 86400)
+        sketch = self.sketches.get(day)
+        if sketch is None:
+            sketch = self.sketches[day] = HyperLogLog()
+            for old in [old for old in self.sketches if old <= day - self.days]:
+                del self.sketches[old]
+        sketch.add(value)
+
+    def counts(self, now):
+        """Return {'today': distinct values today, 'week': distinct values over all kept days}."""
+        day = int(now // 86400)
+        recent = [sketch for sketch_day, sketch in self.sketches.items() if sketch_day > day - self.days]
+        today = self.sketches.get(day)
+        week = None
+        for sketch in recent:
+            week = sketch if week is None else week.merge(sketch)
+        return {'today': today.count() if today else 0, 'week': week.count() if week else 0}
+
+
+class SpaceSaving:
+    """Space-Saving heavy hitters: approximate top counts for a stream in at most capacity entries.
+
+    Keys are grouped into buckets by count (a stream-summary) so the minimum entry is
+    always at hand and each update is O(1). Counts can overestimate by at most the
+    count of the key they replaced, which is kept in errors.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}  # key -> estimated count
+        self.errors = {}  # key -> maximum overestimate
+        self.buckets = {}  # count -> keys with that count
+        self.min_count = 0
+
+    def __len__(self):
+        return len(self.counts)
+
+    # Count one occurrence of a key
+    def add(self, key):
+        """Count key once; return the key evicted to make room for it, if any."""
+        evicted = None
+        count = self.counts.get(key)
+        if count is None:
+            if len(self.counts) < self.capacity:
+                count = 0
+            else:
+                # Take over the slot of a key with the smallest count
+                count = self.min_count
+                evicted = self.buckets[count].pop()
+                del self.counts[evicted]
+                del self.errors[evicted]
+            self.errors[key] = count
+        else:
+            self.buckets[count].discard(key)
+        if count in self.buckets and not self.buckets[count]:
+            del self.buckets[count]
+        self.counts[key] = count + 1
+        self.buckets.setdefault(count + 1, set()).add(key)
+        if count == 0:
+            self.min_count = 1
+        elif count == self.min_count and count not in self.buckets:
+            self.min_count = count + 1
+        return evicted
+
+    # Halve every count
+    def decay(self, halvings=1):
+        """Divide all counts by 2**halvings, dropping keys that reach zero; O(capacity)."""
+        self.counts = {key: count >> halvings for key, count in self.counts.items() if count >> halvings}
+        self.errors = {key: self.errors[key] >> halvings for key in self.counts}
+        self.buckets = {}
+        for key, count in self.counts.items():
+            self.buckets.setdefault(count, set()).add(key)
+        self.min_count = min(self.buckets, default=0)
+
+    # Highest counts
+    def top(self, n):
+        """Return up to n (key, count) pairs, highest count first."""
+        return heapq.nlargest(n, self.counts.items(), key=lambda item: item[1])
+
+
+class TrendingPhrases:
+    """Time-decayed top words and bigrams in a chat, in bounded memory."""
+
+    def __init__(self):
+        self.phrases = SpaceSaving(TRENDING_CAPACITY)
+        self.half_life = TRENDING_HALF_LIFE.total_seconds()
+        self.decayed_at = time.monotonic()
+
+    def add(self, text, now):
+        """Count the message's non-stopword words and adjacent word pairs."""
+        # Halve counts once per elapsed half-life so old chatter fades out
+        halvings = int((now - self.decayed_at) // self.half_life)
+        if halvings:
+            self.phrases.decay(min(halvings, 32))
+            self.decayed_at += halvings * self.half_life
+        previous = None
+        for token in tokenize(text)[:TRENDING_MAX_TOKENS]:
+            if token in STOPWORDS or len(token) < 3 or token.isdigit():
+                previous = None
+                continue
+            self.phrases.add(token)
+            if previous:
+                self.phrases.add(f"{previous} {token}")
+            previous = token
+
+    def top(self, n):
+        """Return up to n (phrase, score) pairs that have come up more than once."""
+        return [(phrase, count) for phrase, count in self.phrases.top(n) if count > 1]
+
+
+class ChatActivity:
+    """Message counts and distinct senders for one chat over each of the STATS_WINDOWS, in fixed memory."""
+
+    def __init__(self):
+        self.windows = {name: RingCounter(slots, width) for name, (slots, width) in STATS_WINDOWS.items()}
+        self.senders = DailySketches()
+        self.talkers = SpaceSaving(LEADERBOARD_CAPACITY)
+        self.names = {}  # user id -> display name, only for users the leaderboard is tracking
+        self.trending = TrendingPhrases()
+
+    def add(self, now, user_id=None, name=None):
+        for window in self.windows.values():
+            window.add(now)
+        if user_id is not None:
+            self.senders.add(user_id, now)
+            evicted = self.talkers.add(user_id)
+            if evicted is not None:
+                self.names.pop(evicted, None)
+            self.names[user_id] = name or str(user_id)
+
+    def counts(self, now):
+        """Return {window name: messages in that window}."""
+        return {name: window.count(now) for name, window in self.windows.items()}
+
+
+class SharedChatCounters:
+    """Per-chat message counters in a memory-mapped file that several processes update safely.
+
+    The file is an open-addressing table of (chat id, count, last message, last quote)
+    slots. Counting locks just the chat's own slot with a byte-range lock, so workers
+    only contend when they touch the same chat at the same moment. The last-quote
+    time lives in the slot too, so the minimum gap between quotes holds across every
+    worker. Finding or claiming a slot for a chat this process hasn't seen takes a
+    lock on the whole table instead. Slots are never emptied, which keeps probe chains
+    intact; a slot whose chat has been idle for CHAT_IDLE_TIMEOUT is handed to the
+    next new chat that probes past it. Only when more than `slots` chats are active
+    at once do the rest fall back to counters local to this process, which then
+    split across workers. The file itself is the persistent state, so nothing needs
+    to be written behind.
+    """
+
+    SLOT = struct.Struct('<qqdd')  # chat id (0 = empty), count, last message time, last quote time (epoch seconds)
+
+    def __init__(self, path, slots=SHARED_COUNTER_SLOTS):
+        if fcntl is None:
+            raise RuntimeError("SHARED_COUNTER_FILE needs POSIX file locking (fcntl)")
+        self.slots = slots
+        self.size = slots * self.SLOT.size
+        self.idle_timeout = CHAT_IDLE_TIMEOUT.total_seconds()
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = os.fstat(self.fd).st_size
+        if size not in (0, self.size):
+            # Written with another slot layout or table size; its slots can't be read as ours
+            logger.warning(f"Shared counter file {path} has an unexpected size ({size} bytes), starting it over")
+            os.ftruncate(self.fd, 0)
+        if size != self.size:
+            os.ftruncate(self.fd, self.size)
+        self.mm = mmap.mmap(self.fd, self.size)
+        self.positions = {}  # chat id -> slot it held when last seen here, to skip re-probing
+        self.overflow = ChatCounters()
+
+    def __len__(self):
+        return len(self.positions) + len(self.overflow)
+
+    # Count a message in a slot the caller has locked
+    def count_in_slot(self, slot, chat_id, every, gap, now):
+        """Update the slot for one more message from chat_id; return True if a quote is due."""
+        offset = slot * self.SLOT.size
+        owner, count, _, quoted_at = self.SLOT.unpack_from(self.mm, offset)
+        if owner != chat_id:
+            count, quoted_at = 0, 0.0  # a fresh or reclaimed slot
+        count += 1
+        fire = count >= every and now - quoted_at >= gap
+        if fire:
+            count, quoted_at = 0, now
+        self.SLOT.pack_into(self.mm, offset, chat_id, count, now, quoted_at)
+        self.positions[chat_id] = slot
+        return fire
+
+    # Find the chat's slot, or claim an empty or idle one, under the table lock
+    def find_slot(self, chat_id, now):
+        """Return the chat's slot, claiming one if needed, or None if every slot is busy. Caller holds the table lock."""
+        start = hash(chat_id) % self.slots
+        reusable = None
+        for probe in range(self.slots):
+            slot = (start + probe) % self.slots
+            owner, _, seen, _ = self.SLOT.unpack_from(self.mm, slot * self.SLOT.size)
+            if owner == chat_id:
+                return slot
+            if owner == 0:
+                # End of the probe chain: the chat has no slot yet
+                return slot if reusable is None else reusable
+            if reusable is None and now - seen >= self.idle_timeout:
+                reusable = slot
+        return reusable
+
+    def tick(self, chat_id, every, gap=0.0):
+        """Add one message; return True (and start counting over) once `every` messages are counted
+        and at least gap seconds have passed since the chat's last quote in any process."""
+        if chat_id in self.overflow.counts:
+            return self.overflow.tick(chat_id, every, gap)
+        now = time.time()
+        slot = self.positions.get(chat_id)
+        if slot is not None:
+            offset = slot * self.SLOT.size
+            fcntl.lockf(self.fd, fcntl.LOCK_EX, self.SLOT.size, offset)
+            try:
+                # Another process may have reclaimed the slot since we last used it
+                if self.SLOT.unpack_from(self.mm, offset)[0] == chat_id:
+                    return self.count_in_slot(slot, chat_id, every, gap, now)
+            finally:
+                fcntl.lockf(self.fd, fcntl.LOCK_UN, self.SLOT.size, offset)
+        fcntl.lockf(self.fd, fcntl.LOCK_EX, self.size, 0)
+        try:
+            slot = self.find_slot(chat_id, now)
+            if slot is not None:
+                return self.count_in_slot(slot, chat_id, every, gap, now)
+        finally:
+            fcntl.lockf(self.fd, fcntl.LOCK_UN, self.size, 0)
+        self.positions.pop(chat_id, None)
+        logger.warning(f"Shared counter table is full, counting chat {chat_id} locally")
+        telemetry.increment('counters.shared.overflow')
+        return self.overflow.tick(chat_id, every, gap)
+
+    @property
+    def dirty(self):
+        # Only overflow chats live in this process and need writing behind
+        return self.overflow.dirty
+
+    def restore(self, counts):
+        pass  # the shared file already holds the counts
+
+    def take_dirty(self):
+        return self.overflow.take_dirty()
+
+    def evict_idle(self, max_idle):
+        """Evict idle overflow chats and forget cached slots of chats that went idle or lost their slot."""
+        cutoff = time.time() - max_idle.total_seconds()
+        for chat_id, slot in list(self.positions.items()):
+            owner, _, seen, _ = self.SLOT.unpack_from(self.mm, slot * self.SLOT.size)
+            if owner != chat_id or seen < cutoff:
+                del self.positions[chat_id]
+        return self.overflow.evict_idle(max_idle)
+
+
+class QuoteCadence:
+    """Per-chat EWMA of message rate, used to space automatic quotes out in time.
+
+    The chat counters keep the time of each chat's last quote and enforce the gap
+    returned here, so with shared counters the spacing holds across processes.
+    """
+
+    def __init__(self):
+        self.chats = {}  # chat id -> [messages/second EWMA, last message time]
+        self.tau = QUOTE_RATE_WINDOW.total_seconds()
+
+    # Update the chat's message rate and work out the current spacing
+    def record(self, chat_id, now):
+        """Add a message at monotonic time now; return the minimum seconds between quotes at the chat's rate."""
+        state = self.chats.get(chat_id)
+        if state is None:
+            state = self.chats[chat_id] = [0.0, now]
+        # Exponentially decayed event rate: converges to the true rate for steady traffic
+        state[0] = state[0] * math.exp(-(now - state[1]) / self.tau) + 1 / self.tau
+        state[1] = now
+        return self.interval(state[0])
+
+    # Minimum spacing between quotes at a given message rate
+    def interval(self, rate):
+        """Return the required gap in seconds, growing with the rate during bursts."""
+        scale = max(1.0, rate / QUOTE_BASELINE_RATE)
+        return min(QUOTE_MIN_INTERVAL.total_seconds() * scale, QUOTE_MAX_INTERVAL.total_seconds())
+
+    # Drop chats that have gone quiet
+    def evict_idle(self, max_idle):
+        """Forget chats with no messages for longer than max_idle."""
+        cutoff = time.monotonic() - max_idle.total_seconds()
+        for chat_id in [chat_id for chat_id, state in self.chats.items() if state[1] < cutoff]:
+            del self.chats[chat_id]
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: finds every pattern in one pass over the text, whatever the number of patterns."""
+
+    def __init__(self, patterns):
+        """Build the automaton from (pattern, value) pairs; a pattern may appear with several values."""
+        self.transitions = [{}]  # state -> {character: next state}
+        self.fail = [0]
+        self.outputs = [[]]  # state -> [(pattern length, value)] ending here
+        for pattern, value in patterns:
+            state = 0
+            for char in pattern:
+                if char not in self.transitions[state]:
+                    self.transitions[state][char] = len(self.transitions)
+                    self.transitions.append({})
+                    self.fail.append(0)
+                    self.outputs.append([])
+                state = self.transitions[state][char]
+            self.outputs[state].append((len(pattern), value))
+
+        # Breadth-first pass to link each state to its longest proper suffix in the trie
+        queue = deque(self.transitions[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.transitions[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.transitions[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.transitions[fallback].get(char, 0)
+                if self.fail[child] == child:
+                    self.fail[child] = 0
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+
+    # Find whole-word matches
+    def search(self, text):
+        """Return the values of all patterns found in text as whole words."""
+        found = set()
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in self.transitions[state]:
+                state = self.fail[state]
+            state = self.transitions[state].get(char, 0)
+            for length, value in self.outputs[state]:
+                start = end - length + 1
+                if (start == 0 or not text[start - 1].isalnum()) and (end + 1 == len(text) or not text[end + 1].isalnum()):
+                    found.add(value)
+        return found
+
+
+def open_database(path):
+    """Open the bot's SQLite database in WAL mode."""
+    db = sqlite3.connect(path)
+    # WAL turns each commit into one sequential append and lets readers run alongside writers
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    return db
+
+
+def normalize(text):
+    """Casefold and collapse whitespace so near-identical suggestions compare equal."""
+    return ' '.join(text.casefold().split())
+
+
+def render_pages(title, entries, empty_text):
+    """Split a numbered list into message-sized pages, each with a title and page number."""
+    lines = [f"{number}. {entry}" for number, entry in enumerate(entries, start=1)] or [empty_text]
+    budget = LIST_PAGE_MAX_CHARS - len(title) - 32  # room for the header line
+    pages = []
+    page, length = [], 0
+    for line in lines:
+        line = line[:budget]
+        if page and (len(page) >= LIST_PAGE_SIZE or length + len(line) + 1 > budget):
+            pages.append(page)
+            page, length = [], 0
+        page.append(line)
+        length += len(line) + 1
+    pages.append(page)
+    return [f"{title} (page {number}/{len(pages)}):\n" + '\n'.join(page) for number, page in enumerate(pages, start=1)]
+
+
+class SqliteListStore:
+    """Suggestions (songs or activities) in a SQLite table with unique normalized fields.
+
+    Only the first field is required; a missing later field (a song with no artist)
+    is stored as NULL and left out of the display text.
+    """
+
+    MIGRATION_BATCH = 1000
+
+    def __init__(self, db, table, fields):
+        self.db = db
+        self.table = table
+        self.fields = fields
+        columns = ', '.join(
+            f"{field} TEXT{' NOT NULL' if field == fields[0] else ''}, {field}_norm TEXT NOT NULL" for field in fields
+        )
+        norms = ', '.join(f"{field}_norm" for field in fields)
+        with db:
+            db.execute(
+                f'CREATE TABLE IF NOT EXISTS {table} ('
+                f'id INTEGER PRIMARY KEY, {columns}, added_by INTEGER, added_at REAL NOT NULL)'
+            )
+            db.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {table}_norm ON {table} ({norms})')
+            db.execute(f'CREATE INDEX IF NOT EXISTS {table}_added_at ON {table} (added_at)')
+            db.execute('CREATE TABLE IF NOT EXISTS migrations (name TEXT PRIMARY KEY, migrated_at REAL NOT NULL)')
+        self.writes = 0  # commits through this connection, which data_version doesn't see
+        self.insert_sql = (
+            f"INSERT OR IGNORE INTO {table} "
+            f"({', '.join(f'{field}, {field}_norm' for field in fields)}, added_by, added_at) "
+            f"VALUES ({', '.join('?' for _ in range(2 * len(fields) + 2))})"
+        )
+
+    def row(self, values, user_id, added_at):
+        """Build the insert parameters for one entry."""
+        params = []
+        for value in values:
+            value = (value or '').strip()
+            # Missing fields normalize to '' so the unique index still sees them as equal
+            params += [value or None, normalize(value)]
+        return params + [user_id, added_at]
+
+    @staticmethod
+    def display(values):
+        """Join an entry's fields into its display text, leaving out missing ones."""
+        return ' - '.join(value for value in values if value)
+
+    # Add an entry
+    def add(self, *values, user_id=None):
+        """Insert an entry unless an equal one exists; return (position, total, added, stored display text)."""
+        params = self.row(values, user_id, time.time())
+        with self.db:
+            cursor = self.db.execute(self.insert_sql, params)
+            total = self.count()
+            if cursor.rowcount == 1:
+                self.writes += 1
+                return total, total, True, self.display(params[0:-2:2])
+            # Already there: find it through the unique index and work out where it sits
+            where = ' AND '.join(f"{field}_norm = ?" for field in self.fields)
+            entry_id, *stored = self.db.execute(
+                f"SELECT id, {', '.join(self.fields)} FROM {self.table} WHERE {where}",
+                [normalize(value or '') for value in values],
+            ).fetchone()
+            position = self.db.execute(f'SELECT COUNT(*) FROM {self.table} WHERE id <= ?', (entry_id,)).fetchone()[0]
+        return position, total, False, self.display(stored)
+
+    def entries(self):
+        """Return every entry as display text, oldest first."""
+        rows = self.db.execute(f"SELECT {', '.join(self.fields)} FROM {self.table} ORDER BY id")
+        return [self.display(row) for row in rows]
+
+    def count(self):
+        return self.db.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+    def version(self):
+        """Return a value that changes whenever the table may have changed."""
+        # data_version moves when another connection commits; writes counts our own
+        return self.db.execute('PRAGMA data_version').fetchone()[0], self.writes
+
+    # Import an existing text file once
+    def migrate_from(self, path):
+        """Stream a one-entry-per-line file into the table in batches, once per file."""
+        name = f"{self.table}:{os.path.abspath(path)}"
+        if not os.path.exists(path) or self.db.execute('SELECT 1 FROM migrations WHERE name = ?', (name,)).fetchone():
+            return
+        migrated = 0
+        now = time.time()
+        with self.db, open(path, 'r') as file:
+            batch = []
+            for line in file:
+                line = line.strip()
+                if not line:
+                    continue
+                # 'title - artist' lines split on the last separator, since titles are likelier to contain one
+                values = line.rsplit(' - ', len(self.fields) - 1) if len(self.fields) > 1 else [line]
+                values += [None] * (len(self.fields) - len(values))
+                batch.append(self.row(values, None, now))
+                if len(batch) >= self.MIGRATION_BATCH:
+                    migrated += len(batch)
+                    self.db.executemany(self.insert_sql, batch)
+                    batch.clear()
+            migrated += len(batch)
+            self.db.executemany(self.insert_sql, batch)
+            self.db.execute('INSERT INTO migrations (name, migrated_at) VALUES (?, ?)', (name, now))
+        logger.info(f"Migrated {migrated} entries from {path} into {self.table}")
+
+
+class ListFileCache:
+    """Process-wide cache of list file contents, keyed on file identity (inode, size, mtime_ns).
+
+    A read costs one stat call while the file is unchanged. When the same file has
+    grown, only the bytes after the last read offset are read, so keeping up with
+    appends costs O(delta). A different inode, a smaller size, or a same-size change
+    (an edit in place) forces a full re-read, so hand edits by admins are picked up.
+    """
+
+    def __init__(self):
+        self.files = {}  # path -> [identity, entries, byte offset read up to, last entry is an unfinished line]
+
+    @staticmethod
+    def identity(path):
+        """Return (inode, size, mtime_ns) for the file, or None if it doesn't exist."""
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def read(self, path):
+        """Return the file's non-blank lines; treat the result as read-only."""
+        identity = self.identity(path)
+        if identity is None:
+            self.files.pop(path, None)
+            return []
+        cached = self.files.get(path)
+        if cached and cached[0] == identity:
+            telemetry.increment('lists.cache.hits')
+            return cached[1]
+        if cached and cached[0][0] == identity[0] and identity[1] > cached[0][1]:
+            telemetry.increment('lists.cache.tail_reads')
+        else:
+            telemetry.increment('lists.cache.full_reads')
+            cached = self.files[path] = [None, [], 0, False]
+        self.read_tail(path, cached, identity)
+        return cached[1]
+
+    def read_tail(self, path, cached, identity):
+        """Read everything after the cached offset and append its lines to the cached entries."""
+        _, entries, offset, partial = cached
+        if partial:
+            # The last line had no newline yet; read it again in full
+            entries.pop()
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            data = file.read()
+        telemetry.increment('lists.cache.bytes_read', len(data))
+        end = data.rfind(b'\n') + 1
+        lines = data[:end].decode('utf-8', errors='replace').splitlines()
+        entries.extend(line.strip() for line in lines if line.strip())
+        rest = data[end:].decode('utf-8', errors='replace').strip()
+        if rest:
+            entries.append(rest)
+        cached[:] = [identity, entries, offset + end, bool(rest)]
+
+
+# Shared by every list reader in the process
+list_file_cache = ListFileCache()
+
+
+class TextListStore:
+    """Suggestions kept one per line in a plain text file."""
+
+    def __init__(self, path, fields):
+        self.path = path
+        self.fields = fields
+
+    def add(self, *values, user_id=None):
+        """Append an entry unless an equal one exists; return (position, total, added, stored display text)."""
+        line = ' - '.join(value.strip() for value in values)
+        entries = self.entries()
+        normalized = normalize(line)
+        for position, entry in enumerate(entries, start=1):
+            if normalize(entry) == normalized:
+                return position, len(entries), False, entry
+        total = len(entries) + 1
+        with open(self.path, 'a') as file:
+            file.write(f"{line}\n")
+        return total, total, True, line
+
+    def entries(self):
+        """Return every non-blank line, oldest first (cached until the file changes)."""
+        return list_file_cache.read(self.path)
+
+    def count(self):
+        return len(self.entries())
+
+    def version(self):
+        """Return the file's identity, which changes whenever the file does."""
+        return list_file_cache.identity(self.path)
+
+
+class CounterStore:
+    """SQLite table of per-chat message counts, written in batched transactions."""
+
+    def __init__(self, db):
+        self.db = db
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS chat_counters ('
+            'chat_id INTEGER PRIMARY KEY, count INTEGER NOT NULL, updated_at REAL NOT NULL)'
+        )
+        self.db.commit()
+
+    # Load counters that are recent enough to still matter
+    def load(self, max_age):
+        """Return (chat id, count) for chats updated within max_age."""
+        cutoff = time.time() - max_age.total_seconds()
+        return self.db.execute('SELECT chat_id, count FROM chat_counters WHERE updated_at >= ?', (cutoff,)).fetchall()
+
+    # Persist a batch of counters
+    def save(self, rows):
+        """Upsert (chat id, count) rows in a single transaction."""
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                'INSERT INTO chat_counters (chat_id, count, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(chat_id) DO UPDATE SET count = excluded.count, updated_at = excluded.updated_at',
+                [(chat_id, count, now) for chat_id, count in rows],
+            )
+
+
+class QuoteProvider:
+    """A source of quotes; fetch returns one formatted quote or None."""
+
+    name = 'provider'
+
+    async def fetch(self):
+        raise NotImplementedError
+
+
+class HTTPQuoteProvider(QuoteProvider):
+    """ZenQuotes-compatible HTTP API, optionally rate limited and guarded by a circuit breaker."""
+
+    def __init__(self, name, client, url, bulk_url=None, rate_limiter=None, breaker=None):
+        self.name = name
+        self.client = client
+        self.url = url
+        self.bulk_url = bulk_url
+        self.rate_limiter = rate_limiter
+        self.breaker = breaker or CircuitBreaker(name, QUOTE_BREAKER_FAILURES, QUOTE_BREAKER_RESET)
+
+    # Format a ZenQuotes entry for posting
+    @staticmethod
+    def format_quote(quote_json):
+        """Format a single ZenQuotes entry as 'quote — author'."""
+        return f"{quote_json['q']} — {quote_json['a']}"
+
+    # Call the API within its rate limit and circuit breaker
+    async def request(self, url):
+        """Return the parsed response, or None if the call was skipped or failed."""
+        metric = f"quote.upstream.{self.name}"
+        if not self.breaker.allow():
+            telemetry.increment(f"{metric}.circuit_open")
+            return None
+        if self.rate_limiter and not self.rate_limiter.try_acquire():
+            logger.info(f"{self.name} request budget used up, skipping upstream call")
+            telemetry.increment(f"{metric}.rate_limited")
+            self.breaker.release()
+            return None
+        telemetry.increment(f"{metric}.requests")
+        started = time.perf_counter()
+        try:
+            response = await self.client.get(url)
+            telemetry.observe(f"{metric}.latency", time.perf_counter() - started)
+            response.raise_for_status()
+            quote_json = response.json()
+            # Throttled clients get a 200 with a placeholder quote attributed to zenquotes.io
+            if not quote_json or quote_json[0].get('a') == 'zenquotes.io':
+                raise ValueError(f"rate limited: {quote_json[0]['q'] if quote_json else 'empty response'}")
+        except asyncio.CancelledError:
+            # A hedge winner or shutdown cancelled us before the upstream answered
+            self.breaker.release()
+            raise
+        except httpx.TimeoutException:
+            logger.warning(f"Timed out fetching quotes from {self.name}")
+            telemetry.increment(f"{metric}.timeouts")
+            self.breaker.record_failure()
+            return None
+        except Exception as e:
+            logger.error(f"Error fetching quotes from {self.name}: {e}")
+            telemetry.increment(f"{metric}.errors")
+            self.breaker.record_failure()
+            return None
+        self.breaker.record_success()
+        return quote_json
+
+    # Fetch a single quote
+    async def fetch(self):
+        """Request one quote, or return None on failure."""
+        quote_json = await self.request(self.url)
+        return self.format_quote(quote_json[0]) if quote_json else None
+
+    # Fetch a batch of quotes from the bulk endpoint
+    async def fetch_batch(self):
+        """Request a batch of quotes, or return an empty list on failure."""
+        if not self.bulk_url:
+            return []
+        quote_json = await self.request(self.bulk_url)
+        return [self.format_quote(item) for item in quote_json or []]
+
+
+class CorpusQuoteProvider(QuoteProvider):
+    """Random quotes from the offline corpus."""
+
+    name = 'corpus'
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    async def fetch(self):
+        return self.corpus.random_quote()
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates from different chats concurrently, and each chat's updates one at a time in arrival order.
+
+    A handler waiting on the network (a quote fetch, say) then only holds up its own
+    chat. Keeping each chat sequential means conversation steps never overtake the
+    command that started them. An update waits for its chat's turn before taking
+    one of the max_concurrent_updates slots, so a backlog in one chat never holds
+    slots the other chats need.
+    """
+
+    def __init__(self, max_concurrent_updates):
+        super().__init__(max_concurrent_updates)
+        self.chats = {}  # chat id -> [lock, updates holding or waiting for it]
+
+    # BaseUpdateProcessor marks this final, but its version takes a slot before do_process_update runs,
+    # which is too early to wait for the chat there
+    async def process_update(self, update, coroutine):
+        """Wait for the chat's earlier updates to finish, then process the update in a free slot."""
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            await super().process_update(update, coroutine)
+            return
+        entry = self.chats.get(chat.id)
+        if entry is None:
+            entry = self.chats[chat.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # asyncio.Lock wakes waiters first come, first served
+            async with entry[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self.chats[chat.id]
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+
+class WeddingBot:
+    def __init__(self, request=None):
         # Load the bot token from environment variables
         self.token = os.getenv('TELEGRAM_BOT_TOKEN')
         if not self.token:
             raise ValueError("Missing environment variable: TELEGRAM_BOT_TOKEN")
         
-        # Initialize the Telegram bot application
-        self.application = Application.builder().token(self.token).build()
-
-        # Add command handlers
-        self.application.add_handler(CommandHandler('start', self.start))
-        self.application.add_handler(CommandHandler('countdown', self.countdown))  
-        self.application.add_handler(CommandHandler('faq', self.faq))  
-        self.application.add_handler(CommandHandler('quote', self.quote))  # Quote command
-        self.application.add_handler(CommandHandler('displaylists', self.display_lists))  # Display both lists
-
-        # Convo handler for /song
-        song_handler = ConversationHandler(
-            entry_points=[CommandHandler('song', self.song_command)],
-            states={
-                SONG_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.get_song_name)],
-                SONG_ARTIST: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.get_song_artist)],
-            },
-            fallbacks=[]
+        # Initialize the Telegram bot application; a slow handler in one chat doesn't hold up the others
+        builder = (
+            Application.builder()
+            .token(self.token)
+            .concurrent_updates(ChatOrderedUpdateProcessor(MAX_CONCURRENT_UPDATES))
+            .post_shutdown(self.on_shutdown)
         )
-        self.application.add_handler(song_handler)
-
-        # Convo handler for /suggestactivity
-        activity_handler = ConversationHandler(
-            entry_points=[CommandHandler('suggestactivity', self.suggest_activity)],
-            states={
-                SUGGEST_ACTIVITY: [MessageHandler(filters.TEXT & ~filters.COMMAND, self.get_activity)]
-            },
-            fallbacks=[]
+        if request is not None:
+            # Bot API transport override, used by the offline benchmarks in bench/
+            builder = builder.request(request)
+        self.application = builder.build()
+
+        # Shared HTTP client for quote fetching (one connection pool for the whole bot)
+        self.http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(QUOTE_READ_TIMEOUT, connect=QUOTE_CONNECT_TIMEOUT),
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=5),
+        )
+
+        # SQLite database for suggestions and counters
+        self.db = open_database(BOT_DB_FILE)
+
+        # Bounded buffer of prefetched quotes; oldest quotes drop off when full
+        self.quote_reservoir = deque(maxlen=QUOTE_RESERVOIR_SIZE)
+
+        # Quotes persisted across restarts; warm the reservoir so a cold start stays off the network
+        self.quote_cache = QuoteCache(QUOTE_CACHE_FILE)
+        self.quote_cache.load()
+        self.quote_reservoir.extend(self.quote_cache.sample(QUOTE_RESERVOIR_SIZE))
+
+        # Quotes each chat has already been shown
+        self.seen_quotes = SeenQuotes()
+
+        # Local quote corpus for venues with bad connectivity
+        self.quote_corpus = None
+        if os.path.exists(QUOTE_CORPUS_FILE) and os.path.getsize(QUOTE_CORPUS_FILE):
+            self.quote_corpus = OfflineQuoteCorpus(QUOTE_CORPUS_FILE)
+
+        # ZenQuotes stays inside its request budget and backs off when it keeps failing
+        self.zenquotes = HTTPQuoteProvider(
+            'zenquotes', self.http_client, QUOTE_API_URL, bulk_url=QUOTE_BULK_API_URL,
+            rate_limiter=TokenBucket(QUOTE_API_BUDGET, QUOTE_API_BUDGET_PERIOD),
         )
-        self.application.add_handler(activity_handler)
 
-        # Add a message handler to track and post a quote every 20 messages
-        self.application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, self.track_messages))
+        # Quote providers in order of preference; slow ones get hedged to the next
+        self.quote_providers = [self.zenquotes]
+        if QUOTE_LOCAL_API_URL:
+            self.quote_providers.append(HTTPQuoteProvider('local', self.http_client, QUOTE_LOCAL_API_URL))
+        if self.quote_corpus:
+            corpus_provider = CorpusQuoteProvider(self.quote_corpus)
+            if QUOTE_SOURCE == 'offline':
+                self.quote_providers.insert(0, corpus_provider)
+            else:
+                self.quote_providers.append(corpus_provider)
+
+        # In-flight upstream quote fetch shared by concurrent callers
+        self.quote_fetch_task = None
+
+        # Message counts per chat, so busy groups don't trigger quotes in quiet ones
+        if SHARED_COUNTER_FILE:
+            # Several bot processes behind a webhook share one counter table
+            self.chat_counters = SharedChatCounters(SHARED_COUNTER_FILE)
+        else:
+            self.chat_counters = ChatCounters()
+
+        # Song and activity suggestions
+        if LIST_STORE == 'files':
+            self.song_store = TextListStore(SONG_FILE, ('title', 'artist'))
+            self.activity_store = TextListStore(ACTIVITY_FILE, ('name',))
+        else:
+            self.song_store = SqliteListStore(self.db, 'songs', ('title', 'artist'))
+            self.activity_store = SqliteListStore(self.db, 'activities', ('name',))
+            self.song_store.migrate_from(SONG_FILE)
+            self.activity_store.migrate_from(ACTIVITY_FILE)
+        self.list_stores = {'songs': self.song_store, 'activities': self.activity_store}
+        self.page_cache = {}  # list name -> (store version, rendered pages)
+
+        # Per-chat message rate, so quotes stay spaced out while a chat is busy
+        self.quote_cadence = QuoteCadence()
+
+        # Automatic FAQ answers: one automaton over every keyword and question cue (cues map to None),
+        # and when each chat last got each answer
+        self.faq_matcher = AhoCorasick(
+            [(cue, None) for cue in FAQ_QUESTION_CUES]
+            + [(keyword, topic) for topic, keywords in FAQ_KEYWORDS.items() for keyword in keywords]
+        )
+        self.faq_answered = {}  # (chat id, topic) -> monotonic time of the last answer
+
+        # Per-chat message activity over the last hour/day/week for /stats
+        self.chat_activity = {}
+
+        # Counters survive restarts: loaded here, flushed to SQLite in the background
+        self.counter_store = CounterStore(self.db)
+        self.chat_counters.restore(self.counter_store.load(CHAT_IDLE_TIMEOUT))
+
+        # Commands, looked up by name in one dict
+        self.commands = {
+            'start': self.start,
+            'countdown': self.countdown,
+            'faq': self.faq,
+            'quote': self.quote,  # Quote command
+            'displaylists': self.display_lists,  # Display both lists
+            'metrics': self.metrics,  # Admin-only telemetry dump
+            'stats': self.stats,  # Chat activity statistics
+            'leaderboard': self.leaderboard,  # Most active guests
+            'trending': self.trending,  # Admin-only trending phrases
+            'song': self.song_command,  # Starts the song conversation
+            'suggestactivity': self.suggest_activity,  # Starts the activity conversation
+        }
+
+        # Conversation steps for /song and /suggestactivity, keyed by state
+        self.conversation_steps = {
+            SONG_NAME: self.get_song_name,
+            SONG_ARTIST: self.get_song_artist,
+            SUGGEST_ACTIVITY: self.get_activity,
+        }
+        self.conversations = {}  # (chat id, user id) -> current conversation state
+
+        # One handler for every new text message; route_update classifies it once
+        self.application.add_handler(MessageHandler(filters.UpdateType.MESSAGE & filters.TEXT, self.route_update))
+
+        # Prev/Next buttons under /displaylists
+        self.application.add_handler(CallbackQueryHandler(self.display_lists_page, pattern=r'^lists:'))
 
         # JobQueue for automatic countdown posting
         job_queue = self.application.job_queue
         job_queue.run_repeating(self.auto_post_countdown, interval=timedelta(days=1), first=datetime.now())
 
+        # JobQueue for keeping the quote reservoir full; offline mode never reads it, so it stays off the network
+        if not self.offline_quotes():
+            job_queue.run_repeating(self.refill_quote_reservoir, interval=QUOTE_REFILL_INTERVAL, first=0)
+
+        # JobQueue for dropping counters of idle chats
+        job_queue.run_repeating(self.evict_idle_chats, interval=CHAT_EVICT_INTERVAL)
+
+        # JobQueue for writing changed counters to disk
+        job_queue.run_repeating(self.flush_chat_counters, interval=COUNTER_FLUSH_INTERVAL)
+
         # Add error handler
         self.application.add_error_handler(self.error_handler)
 
-    # Display both song and activity lists
-    async def display_lists(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Display both the song and activity lists separated by '-----'."""
-        # Read song list
-        song_list = "No songs available."
-        if os.path.exists(SONG_FILE):
-            with open(SONG_FILE, 'r') as file:
-                song_list = file.read().strip() or "No songs available."
+    # Route every text message to a command, a conversation step, or chatter tracking
+    async def route_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Classify a text message once and dispatch it with dict lookups."""
+        message = update.message
+        key = (update.effective_chat.id, update.effective_user.id if update.effective_user else None)
 
-        # Read activity list
-        activity_list = "No activities available."
-        if os.path.exists(ACTIVITY_FILE):
-            with open(ACTIVITY_FILE, 'r') as file:
-                activity_list = file.read().strip() or "No activities available."
+        entities = message.entities
+        if entities and entities[0].type == MessageEntity.BOT_COMMAND and entities[0].offset == 0:
+            command, _, bot_name = message.text[1:entities[0].length].partition('@')
+            if bot_name and bot_name.lower() != context.bot.username.lower():
+                return  # addressed to another bot
+            handler = self.commands.get(command.lower())
+            if handler is None:
+                return
+            context.args = message.text.split()[1:]
+            state = await handler(update, context)
+            if state is not None:
+                # Entry point commands return the conversation's first state
+                self.conversations[key] = state
+            return
 
-        # Combine lists with a separator
-        combined_list = f"Song List:\n{song_list}\n\n-----\n\nActivity List:\n{activity_list}"
+        state = self.conversations.get(key)
+        if state is not None:
+            state = await self.conversation_steps[state](update, context)
+            if state == ConversationHandler.END:
+                self.conversations.pop(key, None)
+            else:
+                self.conversations[key] = state
+            return
 
-        # Send the combined list to the user
-        await context.bot.send_message(chat_id=update.effective_chat.id, text=combined_list)
+        await self.track_messages(update, context)
+
+    # Rendered pages of a list, re-rendered only when the list changes
+    def list_pages(self, name):
+        """Return the cached pages for a list, rendering them again if its version changed."""
+        store = self.list_stores[name]
+        version = store.version()
+        cached = self.page_cache.get(name)
+        if cached and cached[0] == version:
+            telemetry.increment('lists.pages.hits')
+            return cached[1]
+        telemetry.increment('lists.pages.renders')
+        title, empty_text = LISTS[name]
+        pages = render_pages(title, store.entries(), empty_text)
+        self.page_cache[name] = (version, pages)
+        return pages
+
+    # Navigation buttons for a list page
+    def page_keyboard(self, name, page, total):
+        """Build Prev/Next buttons for the page, plus a button to switch to the other list."""
+        navigation = []
+        if page > 0:
+            navigation.append(InlineKeyboardButton("◀ Prev", callback_data=f"lists:{name}:{page - 1}"))
+        if page < total - 1:
+            navigation.append(InlineKeyboardButton("Next ▶", callback_data=f"lists:{name}:{page + 1}"))
+        other = 'activities' if name == 'songs' else 'songs'
+        switch = InlineKeyboardButton(f"Show {LISTS[other][0]}", callback_data=f"lists:{other}:0")
+        return InlineKeyboardMarkup([navigation, [switch]] if navigation else [[switch]])
+
+    # Display the song and activity lists
+    async def display_lists(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show the first page of the song list, with buttons to page through both lists."""
+        pages = self.list_pages('songs')
+        await context.bot.send_message(
+            chat_id=update.effective_chat.id, text=pages[0], reply_markup=self.page_keyboard('songs', 0, len(pages))
+        )
+
+    # Page through the lists in place
+    async def display_lists_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Edit the /displaylists message to show the requested page."""
+        query = update.callback_query
+        await query.answer()
+        _, name, page = query.data.split(':')
+        if name not in self.list_stores:
+            return
+        pages = self.list_pages(name)
+        page = min(int(page), len(pages) - 1)
+        try:
+            await query.edit_message_text(text=pages[page], reply_markup=self.page_keyboard(name, page, len(pages)))
+        except BadRequest as e:
+            # Double taps ask for the page that's already showing
+            if 'not modified' not in str(e):
+                raise
 
     # Start command
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -106,35 +1722,307 @@ class WeddingBot:
             text="Hello! Welcome to the Wedding Planning Bot."
         )
 
+    # Whether quotes come from the offline corpus alone
+    def offline_quotes(self):
+        """Return True when QUOTE_SOURCE is 'offline' and a corpus is loaded."""
+        return QUOTE_SOURCE == 'offline' and self.quote_corpus is not None
+
+    # Refill the quote reservoir from the ZenQuotes bulk endpoint
+    async def refill_quote_reservoir(self, context: ContextTypes.DEFAULT_TYPE):
+        """Top up the in-memory quote reservoir with one batched upstream call."""
+        if len(self.quote_reservoir) >= QUOTE_RESERVOIR_LOW_WATER:
+            return
+        quotes = await self.zenquotes.fetch_batch()
+        if not quotes:
+            return
+        telemetry.increment('quote.reservoir.refills')
+        telemetry.increment('quote.reservoir.refilled_quotes', len(quotes))
+        self.quote_reservoir.extend(quotes)
+        self.quote_cache.add_many(quotes)
+        self.quote_cache.save()
+        logger.info(f"Quote reservoir refilled with {len(quotes)} quotes ({len(self.quote_reservoir)} available)")
+
     # Fetch quote from ZenQuotes API
-    def get_quote(self):
+    async def get_quote(self, chat_id=None):
+        """Return a quote the chat hasn't seen, recording where it came from and how long it took."""
+        started = time.perf_counter()
+        quote, source = await self.select_quote(chat_id)
+        telemetry.observe('quote.get_quote.latency', time.perf_counter() - started)
+        telemetry.increment(f"quote.source.{source}")
+        if quote is None:
+            return "Sorry, I couldn't fetch a quote at the moment."
+        return self.remember_quote(chat_id, quote)
+
+    # Choose a quote from the fastest source that has one
+    async def select_quote(self, chat_id):
+        """Return (quote, source name), trying memory first and the providers last."""
+        if self.offline_quotes():
+            return self.pick_unseen(chat_id, self.quote_corpus.random_quote) or self.quote_corpus.random_quote(), 'corpus'
+
+        quote = self.take_reserved_quote(chat_id)
+        if quote:
+            return quote, 'reservoir'
+        quote = self.pick_unseen(chat_id, self.quote_cache.random_quote)
+        if quote:
+            return quote, 'cache'
+
+        # Coalesce concurrent callers onto one in-flight request and share its result
+        if self.quote_fetch_task is None:
+            self.quote_fetch_task = asyncio.ensure_future(self.fetch_random_quote())
+            self.quote_fetch_task.add_done_callback(self.clear_quote_fetch_task)
+        # Shield so a cancelled caller doesn't cancel the fetch for everyone else
+        quote = await asyncio.shield(self.quote_fetch_task)
+        if quote and not self.seen_quotes.seen(chat_id, quote):
+            return quote, 'upstream'
+        if self.quote_corpus:
+            corpus_quote = self.pick_unseen(chat_id, self.quote_corpus.random_quote)
+            if corpus_quote:
+                return corpus_quote, 'corpus'
+        # Better a repeat than nothing
+        quote = quote or self.quote_cache.random_quote()
+        return quote, 'repeat' if quote else 'failed'
+
+    # Find a cached quote about a topic
+    def get_topic_quote(self, chat_id, topic):
+        """Return a cached quote matching the topic, preferring ones the chat hasn't seen."""
+        matches = list(self.quote_cache.search(topic))
+        telemetry.increment('quote.topic.hit' if matches else 'quote.topic.miss')
+        if not matches:
+            return None
+        quote = self.pick_unseen(chat_id, lambda: random.choice(matches)) or random.choice(matches)
+        return self.remember_quote(chat_id, quote)
+
+    # Take the next prefetched quote the chat hasn't seen
+    def take_reserved_quote(self, chat_id):
+        """Pop an unseen quote from the reservoir, rotating seen ones to the back for other chats."""
+        for _ in range(min(QUOTE_UNSEEN_ATTEMPTS, len(self.quote_reservoir))):
+            quote = self.quote_reservoir.popleft()
+            if chat_id is None or not self.seen_quotes.seen(chat_id, quote):
+                return quote
+            self.quote_reservoir.append(quote)
+        return None
+
+    # Draw random quotes until one is new to the chat
+    def pick_unseen(self, chat_id, pick):
+        """Call pick a few times and return the first quote the chat hasn't seen, or None."""
+        for _ in range(QUOTE_UNSEEN_ATTEMPTS):
+            quote = pick()
+            if quote is None or chat_id is None or not self.seen_quotes.seen(chat_id, quote):
+                return quote
+        return None
+
+    # Record that a quote is being posted to a chat
+    def remember_quote(self, chat_id, quote):
+        """Mark the quote as seen by the chat and return it."""
+        if chat_id is not None and quote:
+            self.seen_quotes.add(chat_id, quote)
+        return quote
+
+    # Forget a finished quote fetch so the next miss starts a new one
+    def clear_quote_fetch_task(self, task):
+        """Reset the shared in-flight fetch once it completes."""
+        if self.quote_fetch_task is task:
+            self.quote_fetch_task = None
+
+    # Fetch from the quote providers, hedging to the next one when the current one is slow
+    async def hedged_fetch(self):
+        """Return (quote, provider) from the first provider to answer, or (None, None) if all fail.
+
+        The next provider is started once QUOTE_HEDGE_DELAY passes without an answer
+        (a hedge), or straight away when a provider fails or raises (a failover), so a
+        slow upstream only costs the budget and a broken one costs nothing.
+        """
+        providers = iter(self.quote_providers)
+        pending = {}  # task -> provider
+        reason = None  # why the next provider is started: 'hedge' or 'failover' (None for the first)
         try:
-            response = requests.get('https://zenquotes.io/api/random')
-            if response.status_code == 200:
-                quote_json = response.json()
-                return f"{quote_json[0]['q']} — {quote_json[0]['a']}"
-            else:
-                return "Sorry, I couldn't fetch a quote at the moment."
-        except Exception as e:
-            logger.error(f"Error fetching quote from ZenQuotes: {e}")
-            return "Sorry, something went wrong while fetching the quote."
+            while True:
+                provider = next(providers, None)
+                if provider is not None:
+                    if reason:
+                        telemetry.increment(f"quote.{reason}.launched")
+                    pending[asyncio.ensure_future(provider.fetch())] = provider
+                elif not pending:
+                    return None, None
+                done, _ = await asyncio.wait(pending, timeout=QUOTE_HEDGE_DELAY, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    provider = pending.pop(task)
+                    if task.exception():
+                        logger.error(f"Quote provider {provider.name} failed: {task.exception()!r}")
+                        telemetry.increment(f"quote.provider.{provider.name}.errors")
+                    elif task.result():
+                        telemetry.increment(f"quote.hedge.won.{provider.name}")
+                        return task.result(), provider
+                reason = 'failover' if done else 'hedge'
+        finally:
+            for task in pending:
+                task.cancel()
+
+    # Fetch a quote on demand and cache it
+    async def fetch_random_quote(self):
+        """Fetch one quote through the providers, caching it if it came from the network."""
+        quote, provider = await self.hedged_fetch()
+        if quote and isinstance(provider, HTTPQuoteProvider):
+            self.quote_cache.add_many([quote])
+        return quote
+
+    # Clean up on shutdown
+    async def on_shutdown(self, application: Application):
+        """Release the pooled connections used for quote fetching and persist caches and counters."""
+        await self.http_client.aclose()
+        self.quote_cache.save()
+        await self.flush_chat_counters()
+        self.db.close()
+        logger.info(f"Final metrics: {telemetry.snapshot()}")
 
     # /quote command
     async def quote(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Send a random quote fetched from ZenQuotes API."""
-        quote = self.get_quote()
-        await context.bot.send_message(chat_id=update.effective_chat.id, text=quote)
+        """Send a random quote, or one about a topic if given (e.g. /quote love)."""
+        chat_id = update.effective_chat.id
+        if context.args:
+            topic = ' '.join(context.args)
+            quote = self.get_topic_quote(chat_id, topic) or f"Sorry, I don't have any quotes about {topic} yet."
+        else:
+            quote = await self.get_quote(chat_id)
+        await context.bot.send_message(chat_id=chat_id, text=quote)
+
+    # /stats command
+    async def stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Report the chat's messages over the last hour, day and week, and roughly how many guests sent them."""
+        activity = self.chat_activity.get(update.effective_chat.id)
+        now = time.time()
+        counts = activity.counts(now) if activity else dict.fromkeys(STATS_WINDOWS, 0)
+        senders = activity.senders.counts(now) if activity else {'today': 0, 'week': 0}
+        text = (
+            "Chat activity:\n"
+            f"Last hour: {counts['hour']} messages\n"
+            f"Last 24 hours: {counts['day']} messages\n"
+            f"Last 7 days: {counts['week']} messages\n\n"
+            f"Guests chatting today: ~{senders['today']}\n"
+            f"Guests chatting in the last 7 days: ~{senders['week']}"
+        )
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+    # /leaderboard command
+    async def leaderboard(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show the chat's most active guests."""
+        activity = self.chat_activity.get(update.effective_chat.id)
+        top = activity.talkers.top(LEADERBOARD_SIZE) if activity else []
+        if not top:
+            text = "No messages tracked yet."
+        else:
+            lines = [f"{rank}. {activity.names.get(user_id, user_id)} — ~{count} messages"
+                     for rank, (user_id, count) in enumerate(top, start=1)]
+            text = "Most active guests:\n" + '\n'.join(lines)
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+    # /trending command
+    async def trending(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Show admins what the chat has been talking about lately."""
+        if not await self.is_admin(update, context):
+            await context.bot.send_message(chat_id=update.effective_chat.id, text="Sorry, only admins can view trends.")
+            return
+        activity = self.chat_activity.get(update.effective_chat.id)
+        top = activity.trending.top(TRENDING_SIZE) if activity else []
+        if not top:
+            text = "Nothing is trending yet."
+        else:
+            text = "Trending in this chat:\n" + '\n'.join(f"{phrase} ({score})" for phrase, score in top)
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+    # Check whether the sender may use admin commands
+    async def is_admin(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Return True in private chats, or for group administrators."""
+        chat = update.effective_chat
+        if chat.type == 'private':
+            return True
+        member = await context.bot.get_chat_member(chat.id, update.effective_user.id)
+        return member.status in ('administrator', 'creator')
+
+    # /metrics command
+    async def metrics(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Send the in-process telemetry to an admin."""
+        if not await self.is_admin(update, context):
+            await context.bot.send_message(chat_id=update.effective_chat.id, text="Sorry, only admins can view metrics.")
+            return
+        hit_ratio = telemetry.ratio([f"quote.source.{source}" for source in QUOTE_HIT_SOURCES],
+                                    [f"quote.source.{source}" for source in QUOTE_SOURCES])
+        hit_ratio = 'n/a' if hit_ratio is None else f"{hit_ratio:.1%}"
+        text = f"Quote cache hit ratio: {hit_ratio}\n\n{telemetry.format()}"
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
 
     # Track messages and post a quote every 20 messages
     async def track_messages(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Track the number of messages in the chat, and post a quote every 20 messages."""
-        global MESSAGE_COUNTER
-        MESSAGE_COUNTER += 1
+        """Track the chat's message activity, and post a quote every 20 messages at a bounded cadence."""
+        chat_id = update.effective_chat.id
+        activity = self.chat_activity.get(chat_id)
+        if activity is None:
+            activity = self.chat_activity[chat_id] = ChatActivity()
+        user = update.effective_user
+        activity.add(time.time(), user.id if user else None, user.first_name if user else None)
+        activity.trending.add(update.message.text, time.monotonic())
 
-        if MESSAGE_COUNTER >= 20:
-            MESSAGE_COUNTER = 0
-            quote = self.get_quote()
-            await context.bot.send_message(chat_id=update.effective_chat.id, text=f"Here's a motivational quote for you:\n\n{quote}")
+        await self.answer_faq_keywords(update, context)
+
+        # Quote every 20 messages, but no sooner than the chat's current minimum interval
+        gap = self.quote_cadence.record(chat_id, time.monotonic())
+        if self.chat_counters.tick(chat_id, QUOTE_EVERY_MESSAGES, gap):
+            quote = await self.get_quote(chat_id)
+            await context.bot.send_message(chat_id=chat_id, text=f"Here's a motivational quote for you:\n\n{quote}")
+
+    # Answer FAQ questions spotted in chatter
+    async def answer_faq_keywords(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Reply with the FAQ answer for any topic a question mentions, at most once per cooldown per chat."""
+        text = update.message.text.lower()
+        topics = self.faq_matcher.search(text)
+        if None not in topics and '?' not in text:
+            return  # not a question
+        topics.discard(None)
+        if not topics:
+            return
+        chat_id = update.effective_chat.id
+        now = time.monotonic()
+        cooldown = FAQ_ANSWER_COOLDOWN.total_seconds()
+        answers = []
+        for topic in sorted(topics):
+            if now - self.faq_answered.get((chat_id, topic), -cooldown) >= cooldown:
+                self.faq_answered[(chat_id, topic)] = now
+                answers.append(FAQ_ANSWERS[topic])
+        if answers:
+            telemetry.increment('faq.auto_answers', len(answers))
+            await context.bot.send_message(chat_id=chat_id, text='\n\n'.join(answers))
+
+    # Drop message counters for chats that have gone quiet
+    async def evict_idle_chats(self, context: ContextTypes.DEFAULT_TYPE):
+        """Evict per-chat state for chats idle longer than CHAT_IDLE_TIMEOUT."""
+        evicted = self.chat_counters.evict_idle(CHAT_IDLE_TIMEOUT)
+        self.quote_cadence.evict_idle(CHAT_IDLE_TIMEOUT)
+        now = time.time()
+        for chat_id in [chat_id for chat_id, activity in self.chat_activity.items() if not activity.counts(now)['week']]:
+            del self.chat_activity[chat_id]
+        cutoff = time.monotonic() - FAQ_ANSWER_COOLDOWN.total_seconds()
+        for key in [key for key, answered_at in self.faq_answered.items() if answered_at < cutoff]:
+            del self.faq_answered[key]
+        if evicted:
+            logger.info(f"Evicted counters for {evicted} idle chats ({len(self.chat_counters)} active)")
+
+    # Write changed chat counters to the database
+    async def flush_chat_counters(self, context: ContextTypes.DEFAULT_TYPE = None):
+        """Persist every counter changed since the last flush in one transaction."""
+        rows = self.chat_counters.take_dirty()
+        if not rows:
+            return
+        started = time.perf_counter()
+        try:
+            self.counter_store.save(rows)
+        except sqlite3.Error as e:
+            logger.error(f"Could not flush chat counters: {e}")
+            self.chat_counters.dirty.update(chat_id for chat_id, _ in rows)
+            telemetry.increment('counters.flush.errors')
+            return
+        telemetry.observe('counters.flush.latency', time.perf_counter() - started)
+        telemetry.increment('counters.flush.batches')
+        telemetry.increment('counters.flush.rows', len(rows))
 
     # Song suggestion command
     async def song_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -153,23 +2041,25 @@ class WeddingBot:
         await context.bot.send_message(chat_id=update.effective_chat.id, text="Now, enter the artist's name:")
         return SONG_ARTIST  # Transition to SONG_ARTIST state
 
-    # Get artist name and save the song to file
+    # Get artist name and save the song
     async def get_song_artist(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Receive the artist name, save the song, and show the updated song list."""
-        song_name = context.user_data.get('song_name')
+        """Receive the artist name, save the song, and confirm where it landed on the playlist."""
+        song_name = context.user_data.pop('song_name', None)
         artist_name = update.message.text
+        if not song_name:
+            # The title step was skipped or its data lost; don't save a song without one
+            await context.bot.send_message(
+                chat_id=update.effective_chat.id, text="Sorry, I lost the song title. Please start again with /song."
+            )
+            return ConversationHandler.END
 
-        # Save the song to file
-        with open(SONG_FILE, 'a') as file:
-            file.write(f"{song_name} - {artist_name}\n")
+        # Save the song
+        position, total, added, entry = self.song_store.add(song_name, artist_name, user_id=update.effective_user.id)
 
-        # Notify the user and send the updated song list
-        await context.bot.send_message(chat_id=update.effective_chat.id, text="Song added! Here is the updated playlist:")
-
-        with open(SONG_FILE, 'r') as file:
-            song_list = file.read()
-
-        await context.bot.send_message(chat_id=update.effective_chat.id, text=song_list)
+        # Confirm with just the new entry; /displaylists pages through the rest
+        status = "Song added!" if added else "That song is already on the playlist!"
+        text = f"{status} #{position} of {total}: {entry}\nUse /displaylists to see the whole playlist."
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
         return ConversationHandler.END  # End the conversation
 
     # Suggest activity command
@@ -179,24 +2069,18 @@ class WeddingBot:
         await context.bot.send_message(chat_id=update.effective_chat.id, text=f"{user.first_name}, please suggest an activity for the wedding:")
         return SUGGEST_ACTIVITY  # Transition to SUGGEST_ACTIVITY state
 
-    # Get activity and save it to file
+    # Get activity and save it
     async def get_activity(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Get the suggested activity from the user, save it to file, and display the updated activity list."""
+        """Get the suggested activity from the user, save it, and confirm where it landed on the list."""
         activity = update.message.text
 
-        # Save the activity to file
-        with open(ACTIVITY_FILE, 'a') as file:
-            file.write(f"{activity}\n")
-
-        # Notify the user that the activity has been added
-        await context.bot.send_message(chat_id=update.effective_chat.id, text="Activity added! Here is the updated activity list:")
-
-        # Output the full activity list
-        with open(ACTIVITY_FILE, 'r') as file:
-            activity_list = file.read()
+        # Save the activity
+        position, total, added, entry = self.activity_store.add(activity, user_id=update.effective_user.id)
 
-        # Send the updated activity list to the user
-        await context.bot.send_message(chat_id=update.effective_chat.id, text=activity_list)
+        # Confirm with just the new entry; /displaylists pages through the rest
+        status = "Activity added!" if added else "That activity is already on the list!"
+        text = f"{status} #{position} of {total}: {entry}\nUse /displaylists to see the whole list."
+        await context.bot.send_message(chat_id=update.effective_chat.id, text=text)
         return ConversationHandler.END  # End the conversation
 
     # Countdown command
@@ -247,13 +2131,13 @@ _About the Bot_
 \- Type `/song` in the chat and follow the prompts to suggest a song title and artist\. The bot will add it to the playlist\.
 
 *How do I suggest an activity for the wedding?*
-\- Type `/suggestactivity` in the chat, and the bot will prompt you to suggest a fun activity\. Once submitted, the bot will show the updated list of activities\.
+\- Type `/suggestactivity` in the chat, and the bot will prompt you to suggest a fun activity\. Once submitted, the bot will tell you where it landed on the list\. Use `/displaylists` to page through all the suggestions\.
 
 *How do I check how many days are left until the wedding?*
 \- Type `/daysuntil` to see the current countdown to the big day\.
 
 *Does the bot do anything automatically?*
-\- The bot automatically posts countdown updates every month\. As the wedding day approaches, it will post weekly\. In the final week, it posts daily reminders\. It also sends a motivational quote every 20 messages in the chat\. Type `/quote` to see a quote on demand\.
+\- The bot automatically posts countdown updates every month\. As the wedding day approaches, it will post weekly\. In the final week, it posts daily reminders\. It also sends a motivational quote every 20 messages in the chat\. Type `/quote` to see a quote on demand, or `/quote love` for one about a topic\. When someone asks about something covered in this FAQ, like parking or the dress code, it replies with the answer\.
 
 *What do I do if the bot isn’t responding correctly?*
 \- If the bot seems unresponsive, try typing the command again or asking an admin for help\.
@@ -0,0 +1,63 @@
+"""Insert and list latency of SqliteListStore at 100k songs.
+
+A song file with --entries lines is migrated into a fresh database, then new
+songs and duplicates are added one at a time and the full list is read back,
+each timed separately. The text-file store is measured the same way for
+comparison.
+
+    python bench/list_store.py --entries 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from offline import load_weddingbot, percentile  # noqa: E402
+
+
+def timed(function, repeat):
+    """Call function repeat times; return the latencies in milliseconds."""
+    latencies = []
+    for n in range(repeat):
+        started = time.perf_counter()
+        function(n)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def report(label, latencies):
+    print(f"{label:<32} p50 {percentile(latencies, 0.5):8.3f} ms   p99 {percentile(latencies, 0.99):8.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=100000, help="songs in the list")
+    parser.add_argument('--inserts', type=int, default=1000, help="songs added one at a time")
+    parser.add_argument('--reads', type=int, default=20, help="full-list reads")
+    args = parser.parse_args()
+
+    wb = load_weddingbot()
+    with open('songs.txt', 'w') as file:
+        file.writelines(f"Song {n} - Artist {n % 997}\n" for n in range(args.entries))
+
+    db = wb.open_database('bench.db')
+    sqlite_store = wb.SqliteListStore(db, 'songs', ('title', 'artist'))
+    started = time.perf_counter()
+    sqlite_store.migrate_from('songs.txt')
+    print(f"sqlite: migrated {sqlite_store.count()} songs in {time.perf_counter() - started:.2f} s")
+    text_store = wb.TextListStore('songs.txt', ('title', 'artist'))
+
+    for name, store in (('sqlite', sqlite_store), ('files', text_store)):
+        report(f"{name}: add new song", timed(lambda n: store.add(f"New song {n}", "Someone"), args.inserts))
+        spread = args.entries // args.inserts  # duplicates from all over the list, not just its start
+        report(f"{name}: add duplicate", timed(
+            lambda n: store.add(f"song {n * spread}", f"artist {n * spread % 997}"), args.inserts
+        ))
+        report(f"{name}: full list", timed(lambda n: store.entries(), args.reads))
+        report(f"{name}: count", timed(lambda n: store.count(), args.reads))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Helpers for running WeddingBot in benchmarks without Telegram or the network."""
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_weddingbot():
+    """Import WeddingBot with its token and state files pointed at a scratch directory."""
+    workdir = tempfile.mkdtemp(prefix='weddingbot-bench-')
+    os.environ['TELEGRAM_BOT_TOKEN'] = '123456:offline'
+    os.environ['BOT_DB_FILE'] = os.path.join(workdir, 'wedding_bot.db')
+    os.environ.pop('SHARED_COUNTER_FILE', None)
+    os.environ.pop('QUOTE_LOCAL_API_URL', None)
+    os.chdir(workdir)  # the quote cache and list files are relative paths
+    sys.path.insert(0, REPO_DIR)
+    import WeddingBot
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+    return WeddingBot
+
+
+class OfflineBotAPI(BaseRequest):
+    """Answers Bot API calls locally, after an optional simulated round trip."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self.message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None,
+                         write_timeout=None, connect_timeout=None, pool_timeout=None):
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        endpoint = url.rsplit('/', 1)[-1]
+        parameters = request_data.parameters if request_data else {}
+        if endpoint == 'getMe':
+            result = {'id': 123456, 'is_bot': True, 'first_name': 'WeddingBot', 'username': 'wedding_bot'}
+        elif endpoint == 'sendMessage':
+            result = {
+                'message_id': next(self.message_ids), 'date': int(time.time()),
+                'chat': {'id': parameters['chat_id'], 'type': 'group'}, 'text': parameters.get('text', ''),
+            }
+        else:
+            result = True
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+
+def text_update(bot, update_id, chat_id, user_id, text):
+    """Build a group text message Update, marking a leading /command the way Telegram does."""
+    message = {
+        'message_id': update_id, 'date': int(time.time()), 'text': text,
+        'chat': {'id': chat_id, 'type': 'group', 'title': f'Chat {chat_id}'},
+        'from': {'id': user_id, 'is_bot': False, 'first_name': f'Guest{user_id}'},
+    }
+    if text.startswith('/'):
+        message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return Update.de_json({'update_id': update_id, 'message': message}, bot)
+
+
+def percentile(values, fraction):
+    """Return the value at the given fraction of the sorted values."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
@@ -0,0 +1,112 @@
+"""Latency of ordinary chat messages while /quote waits on a slow ZenQuotes.
+
+Plain messages arrive from several chats at a steady rate while another chat keeps
+sending /quote against an upstream that takes --upstream-delay seconds to answer,
+each /quote followed by --backlog more messages from the same chat. The backlog
+waits behind the /quote; with more of it than MAX_CONCURRENT_UPDATES it would
+take every processing slot if waiting for a chat held one. Each update is timed from arrival to the end of its handling. The run is repeated
+with updates processed one at a time (MAX_CONCURRENT_UPDATES = 1, how the bot used
+to run) and with the bot's chat-ordered concurrency.
+
+    python bench/quote_latency.py --upstream-delay 2 --duration 10
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from offline import OfflineBotAPI, load_weddingbot, percentile, text_update  # noqa: E402
+
+
+async def run(wb, concurrency, quote_load, args):
+    """Replay the traffic once; return {'chatter': [seconds], 'quote': [seconds]}."""
+    wb.MAX_CONCURRENT_UPDATES = concurrency
+    wb.QUOTE_EVERY_MESSAGES = 10 ** 9  # only /quote reaches the upstream
+    if os.path.exists(wb.QUOTE_CACHE_FILE):
+        os.remove(wb.QUOTE_CACHE_FILE)  # start every run cold
+    bot = wb.WeddingBot(request=OfflineBotAPI(args.api_latency))
+    served = itertools.count(1)
+
+    async def slow_zenquotes(request):
+        await asyncio.sleep(args.upstream_delay)
+        return httpx.Response(200, json=[{'q': f"Quote {next(served)}", 'a': 'Someone'}])
+
+    bot.zenquotes.client = httpx.AsyncClient(transport=httpx.MockTransport(slow_zenquotes))
+    bot.zenquotes.rate_limiter = None  # measure the slow upstream, not the request budget
+    bot.quote_reservoir.clear()
+    application = bot.application
+    await application.initialize()
+
+    latencies = {'chatter': [], 'quote': [], 'backlog': []}
+    tasks = []
+    update_ids = itertools.count(1)
+
+    def dispatch(kind, chat_id, text):
+        update = text_update(application.bot, next(update_ids), chat_id, chat_id, text)
+        started = time.perf_counter()
+        task = asyncio.create_task(
+            application.update_processor.process_update(update, application.process_update(update))
+        )
+        task.add_done_callback(lambda _: latencies[kind].append(time.perf_counter() - started))
+        tasks.append(task)
+
+    begin = time.perf_counter()
+    sent = 0
+    next_quote = 0.0
+    while (elapsed := time.perf_counter() - begin) < args.duration:
+        if quote_load and elapsed >= next_quote:
+            dispatch('quote', 1000, '/quote')  # one chat, so every /quote misses the cache
+            for n in range(args.backlog):
+                dispatch('backlog', 1000, f"waiting for that quote {n}")
+            next_quote += args.quote_interval
+        while sent < elapsed * args.rate:
+            dispatch('chatter', 1 + sent % args.chats, f"message {sent} about the wedding")
+            sent += 1
+        await asyncio.sleep(0.005)
+    await asyncio.gather(*tasks)
+
+    await bot.zenquotes.client.aclose()
+    await application.shutdown()
+    await bot.on_shutdown(application)
+    return latencies
+
+
+def row(label, latencies):
+    chatter = latencies['chatter']
+    quote = latencies['quote']
+    quote_p50 = f"{percentile(quote, 0.5) * 1000:9.0f}" if quote else f"{'-':>9}"
+    return (f"{label:<34} {percentile(chatter, 0.5) * 1000:9.1f} {percentile(chatter, 0.95) * 1000:9.1f} "
+            f"{max(chatter) * 1000:9.1f} {quote_p50}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds of traffic per run")
+    parser.add_argument('--rate', type=float, default=50.0, help="plain messages per second")
+    parser.add_argument('--chats', type=int, default=20, help="chats the plain messages come from")
+    parser.add_argument('--quote-interval', type=float, default=2.5, help="seconds between /quote commands")
+    parser.add_argument('--upstream-delay', type=float, default=2.0, help="seconds ZenQuotes takes to answer")
+    parser.add_argument('--api-latency', type=float, default=0.02, help="simulated Bot API round trip, seconds")
+    parser.add_argument('--backlog', type=int, help="messages queued behind each /quote in its chat "
+                        "(default: MAX_CONCURRENT_UPDATES + 6)")
+    args = parser.parse_args()
+
+    wb = load_weddingbot()
+    concurrency = wb.MAX_CONCURRENT_UPDATES
+    if args.backlog is None:
+        args.backlog = concurrency + 6
+    print(f"{'configuration':<34} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'/quote p50':>9}")
+    for label, limit in (("one update at a time", 1), (f"chat-ordered, up to {concurrency}", concurrency)):
+        for quote_load in (False, True):
+            latencies = await run(wb, limit, quote_load, args)
+            print(row(f"{label}{', /quote load' if quote_load else ''}", latencies))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
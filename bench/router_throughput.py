@@ -0,0 +1,104 @@
+"""Updates/sec through route_update versus the handler chain it replaced.
+
+The legacy chain is the one WeddingBot.__init__ registered before route_update:
+a CommandHandler per command, a ConversationHandler each for /song and
+/suggestactivity, and a catch-all MessageHandler for chatter. Both are driven
+through Application.process_update with the same synthetic updates, against an
+offline Bot API, so the difference is the dispatch cost.
+
+    python bench/router_throughput.py --updates 20000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+import warnings
+
+from telegram.ext import CommandHandler, ConversationHandler, MessageHandler, filters
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from offline import OfflineBotAPI, load_weddingbot, text_update  # noqa: E402
+
+
+def install_legacy_handlers(wb, bot):
+    """Swap route_update for the CommandHandler/ConversationHandler chain it replaced."""
+    application = bot.application
+    for handler in list(application.handlers[0]):
+        if isinstance(handler, MessageHandler):
+            application.remove_handler(handler)
+    for name in ('start', 'countdown', 'faq', 'quote', 'displaylists', 'metrics', 'stats', 'leaderboard', 'trending'):
+        application.add_handler(CommandHandler(name, bot.commands[name]))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')  # PTB's per_message advice doesn't apply here
+        application.add_handler(ConversationHandler(
+            entry_points=[CommandHandler('song', bot.song_command)],
+            states={
+                wb.SONG_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, bot.get_song_name)],
+                wb.SONG_ARTIST: [MessageHandler(filters.TEXT & ~filters.COMMAND, bot.get_song_artist)],
+            },
+            fallbacks=[],
+        ))
+        application.add_handler(ConversationHandler(
+            entry_points=[CommandHandler('suggestactivity', bot.suggest_activity)],
+            states={wb.SUGGEST_ACTIVITY: [MessageHandler(filters.TEXT & ~filters.COMMAND, bot.get_activity)]},
+            fallbacks=[],
+        ))
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, bot.track_messages))
+
+
+def workload(bot, count, mixed):
+    """Build count updates: plain chatter, or chatter with commands and /song conversations mixed in."""
+    updates = []
+    for update_id in range(1, count + 1):
+        chat_id = 1 + update_id % 50
+        user_id = 100 + update_id % 500
+        text = f"see you all at the party number {update_id}"
+        if mixed and update_id % 20 == 0:
+            text = '/countdown'
+        elif mixed and update_id % 50 in (1, 2, 3):
+            # /song, title and artist from one user in one chat, in that order
+            chat_id, user_id = 1 + update_id // 50 % 50, 100 + update_id // 50
+            text = ('/song', f"Song {update_id // 50}", "Some Artist")[update_id % 50 - 1]
+        updates.append(text_update(bot.application.bot, update_id, chat_id, user_id, text))
+    return updates
+
+
+async def measure(wb, legacy, mixed, count):
+    """Return updates/sec for one handler setup and workload."""
+    wb.BOT_DB_FILE = f"bench-{'legacy' if legacy else 'router'}-{'mixed' if mixed else 'chatter'}.db"
+    bot = wb.WeddingBot(request=OfflineBotAPI())
+    if legacy:
+        install_legacy_handlers(wb, bot)
+    application = bot.application
+    await application.initialize()
+    updates = workload(bot, count, mixed)
+    started = time.perf_counter()
+    for update in updates:
+        await application.process_update(update)
+    elapsed = time.perf_counter() - started
+    await application.shutdown()
+    await bot.on_shutdown(application)
+    return count / elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=20000, help="updates per run")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per setup; the best is reported")
+    args = parser.parse_args()
+
+    wb = load_weddingbot()
+    wb.QUOTE_EVERY_MESSAGES = 10 ** 9  # keep quote fetching out of the dispatch numbers
+    print(f"{'workload':<10} {'legacy chain':>14} {'route_update':>14} {'speedup':>8}")
+    for mixed in (False, True):
+        rates = {}
+        for legacy in (True, False):
+            rates[legacy] = max([await measure(wb, legacy, mixed, args.updates) for _ in range(args.repeat)])
+        print(f"{'mixed' if mixed else 'chatter':<10} {rates[True]:>10.0f} u/s {rates[False]:>10.0f} u/s "
+              f"{rates[False] / rates[True]:>7.2f}x")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,85 @@
+"""Increments/sec on SharedChatCounters from 1 to N worker processes.
+
+Each worker counts --increments messages spread over --chats chats, all in one
+shared counter file, so workers contend on the same slots. After each run the
+quotes fired are checked against the exact number expected (one per
+QUOTE_EVERY_MESSAGES messages per chat). A second check has every worker hammer
+a single chat where every message is a quote candidate but quotes need a
+minimum gap, and compares the quotes fired across all of them with the most
+that gap allows.
+
+    python bench/shared_counters.py --max-workers 8
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from offline import load_weddingbot  # noqa: E402
+
+EVERY = 20
+
+
+def count_messages(path, chats, increments, every, gap, start, results):
+    """Worker: tick the counters and report how many quotes fired."""
+    wb = load_weddingbot()
+    counters = wb.SharedChatCounters(path)
+    start.wait()
+    fired = 0
+    for n in range(increments):
+        fired += counters.tick(1 + n % chats, every, gap)
+    results.put(fired)
+
+
+def run(path, workers, chats, increments, every=EVERY, gap=0.0):
+    """Run the workers at once; return (increments/sec across all of them, quotes fired, seconds taken)."""
+    if os.path.exists(path):
+        os.remove(path)
+    context = multiprocessing.get_context('fork')
+    start = context.Event()
+    results = context.Queue()
+    processes = [context.Process(target=count_messages, args=(path, chats, increments, every, gap, start, results))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    time.sleep(0.5)  # let every worker map the file before the clock starts
+    began = time.perf_counter()
+    start.set()
+    fired = sum(results.get() for _ in processes)
+    elapsed = time.perf_counter() - began
+    for process in processes:
+        process.join()
+    return workers * increments / elapsed, fired, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--max-workers', type=int, default=min(8, os.cpu_count() or 1))
+    parser.add_argument('--increments', type=int, default=100000, help="messages counted per worker")
+    parser.add_argument('--chats', type=int, default=100, help="chats the messages are spread over")
+    args = parser.parse_args()
+
+    load_weddingbot()
+    path = os.path.join(os.getcwd(), 'shared_counters.bin')
+    workers = 1
+    print(f"{'workers':>7} {'increments/s':>13} {'quotes':>8} {'expected':>9}")
+    while workers <= args.max_workers:
+        rate, fired, _ = run(path, workers, args.chats, args.increments)
+        per_chat = workers * args.increments // args.chats
+        expected = args.chats * (per_chat // EVERY)
+        print(f"{workers:>7} {rate:>13.0f} {fired:>8} {expected:>9}")
+        workers *= 2
+
+    # Every message in one chat is a quote candidate; the shared last-quote time must space them out
+    gap = 0.005
+    _, fired, elapsed = run(path, args.max_workers, 1, args.increments, every=1, gap=gap)
+    allowed = int(elapsed / gap) + 1
+    print(f"\n{args.max_workers} workers, one chat, {gap * 1000:.0f} ms minimum gap, {elapsed:.2f} s: "
+          f"{fired} quotes fired, at most {allowed} allowed")
+
+
+if __name__ == '__main__':
+    main()